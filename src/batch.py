@@ -0,0 +1,121 @@
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from clue import init, process_events
+from gamefile import load_yaml
+
+
+def game_files(patterns):
+    # directories are searched for yaml files, anything else is a glob
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in ("yml", "yaml"):
+                files.extend(
+                    glob.glob(os.path.join(pattern, "**", f"*.{extension}"), recursive=True)
+                )
+        else:
+            files.extend(glob.glob(pattern, recursive=True))
+    return sorted(set(files))
+
+
+def knowledge_matrix(game):
+    # player name -> card -> "has", "lacks" or "unknown"
+    matrix = {}
+    for player in game.players:
+        row = {}
+        for card in game.cards_by_index:
+            bit = game.card_bit(card)
+            if player.has_mask & bit:
+                row[card] = "has"
+            elif player.does_not_have_mask & bit:
+                row[card] = "lacks"
+            else:
+                row[card] = "unknown"
+        matrix[player.name] = row
+    return matrix
+
+
+def analyze_game(filename):
+    # one jsonl record for a finished game file. errors are recorded in the
+    # record so one bad file does not stop the batch
+    record = {"file": filename}
+    start = time.perf_counter()
+    try:
+        with open(filename, "rb") as file:
+            data = load_yaml(file.read())
+        game = init(data["setup"])
+        solved_at = None
+        for index, event in enumerate(data["events"]):
+            process_events(game, [event])
+            if solved_at is None and game.is_solved():
+                solved_at = index
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["seconds"] = time.perf_counter() - start
+        return record
+
+    record["seconds"] = time.perf_counter() - start
+    record["events"] = len(data["events"])
+    record["solved_at_event"] = solved_at
+    record["solution"] = (
+        {
+            "suspect": game.suspect_solution(),
+            "weapon": game.weapon_solution(),
+            "room": game.room_solution(),
+        }
+        if game.is_solved()
+        else None
+    )
+    record["knowledge"] = knowledge_matrix(game)
+    return record
+
+
+def quiet_logging():
+    # clue logs every inference at debug level
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="analyze many finished games in parallel, one json line per game"
+    )
+    parser.add_argument("paths", nargs="+", help="directories or globs of game files")
+    parser.add_argument("--output", help="jsonl file to write, defaults to stdout")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="defaults to the number of cpus"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    quiet_logging()
+    files = game_files(args.paths)
+    output = open(args.output, "w") if args.output else sys.stdout
+    failed = 0
+    try:
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=quiet_logging,
+        ) as executor:
+            for record in executor.map(analyze_game, files, chunksize=16):
+                if "error" in record:
+                    failed += 1
+                output.write(json.dumps(record) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"analyzed {len(files)} games, {failed} failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
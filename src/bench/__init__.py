@@ -0,0 +1 @@
+from bench.generator import generate_game
@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from bench.generator import generate_game
+from clue import init, parse_suggestion, process_events
+
+# name -> generate_game arguments
+SCENARIOS = {
+    "standard": {"players": 5, "events": 60},
+    "long": {"players": 6, "events": 500},
+    "large-deck": {"players": 8, "suspects": 30, "weapons": 30, "rooms": 40, "events": 1000},
+}
+
+
+def timed(function, repeat):
+    # best and median wall time over repeat runs, and the last result
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times), result
+
+
+def benchmark(name, game_data, repeat):
+    setup = game_data["setup"]
+    events = game_data["events"]
+    texts = [event["q"] for event in events if "q" in event]
+    texts += [event["accuse"] for event in events if "accuse" in event]
+
+    init_best, init_median, _ = timed(lambda: init(setup), repeat)
+
+    parse_game = init(setup)
+    parse_best, parse_median, _ = timed(
+        lambda: [parse_suggestion(parse_game, text) for text in texts], repeat
+    )
+
+    def replay():
+        game = init(setup)
+        process_events(game, events)
+        return game
+
+    # init is included here, subtract the init time for the inference only
+    process_best, process_median, game = timed(replay, repeat)
+    process_best = max(process_best - init_best, 0.0)
+    process_median = max(process_median - init_median, 0.0)
+
+    render_best, render_median, _ = timed(lambda: str(game), repeat)
+
+    tracemalloc.start()
+    str(replay())
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    card_count = len(game.cards_by_index)
+    return {
+        "name": name,
+        "players": len(game.players),
+        "cards": card_count,
+        "events": len(events),
+        "repeat": repeat,
+        "init_seconds": init_best,
+        "init_median_seconds": init_median,
+        "parse_seconds": parse_best,
+        "parse_median_seconds": parse_median,
+        "process_events_seconds": process_best,
+        "process_events_median_seconds": process_median,
+        "render_seconds": render_best,
+        "render_median_seconds": render_median,
+        "events_per_second": len(events) / process_best if process_best else None,
+        "peak_memory_bytes": peak_memory,
+        "facts_processed": game.facts_processed,
+        "solved": game.is_solved(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="time the clue engine on generated games. runs the built in "
+        "scenarios unless a size option is given"
+    )
+    parser.add_argument("--players", type=int)
+    parser.add_argument("--suspects", type=int)
+    parser.add_argument("--weapons", type=int)
+    parser.add_argument("--rooms", type=int)
+    parser.add_argument("--events", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="bench_results.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    custom = {
+        key: getattr(args, key)
+        for key in ("players", "suspects", "weapons", "rooms", "events")
+        if getattr(args, key) is not None
+    }
+    scenarios = {"custom": custom} if custom else SCENARIOS
+
+    results = []
+    for name, options in scenarios.items():
+        game_data = generate_game(seed=args.seed, **options)
+        result = benchmark(name, game_data, args.repeat)
+        results.append(result)
+        print(
+            f"{name}: {result['events']} events, {result['cards']} cards, "
+            f"{result['players']} players: "
+            f"init {result['init_seconds'] * 1000:.2f}ms, "
+            f"parse {result['parse_seconds'] * 1000:.2f}ms, "
+            f"process {result['process_events_seconds'] * 1000:.2f}ms "
+            f"({result['events_per_second'] or 0:.0f} events/s), "
+            f"render {result['render_seconds'] * 1000:.2f}ms, "
+            f"peak {result['peak_memory_bytes'] / 1024:.0f}KiB, "
+            f"{result['facts_processed']} facts"
+        )
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "seed": args.seed,
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main()
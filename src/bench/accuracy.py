@@ -0,0 +1,85 @@
+import argparse
+import logging
+import sys
+
+from bench.generator import generate_game
+from clue import init, process_events
+from probability import deal_probabilities
+from sampling import sample_probabilities
+
+# generate_game arguments of the games checked by default. seed 5 has only
+# three consistent deals, which a chain swapping two cards at a time cannot
+# move between
+GAMES = [
+    {"seed": 5, "players": 5, "events": 30},
+    {"seed": 1, "players": 5, "events": 20},
+    {"seed": 2, "players": 4, "events": 25},
+    {"seed": 3, "players": 6, "events": 30},
+    {"seed": 4, "players": 3, "events": 15},
+    {"seed": 6, "players": 5, "events": 40},
+]
+# an estimate may miss the exact odds by twice its interval plus this much
+TOLERANCE = 0.02
+
+
+def check_game(options, samples, workers):
+    # the sampled odds against the exact ones, as the cells that missed by
+    # more than allowed and (miss, cell) for the biggest miss
+    game_data = generate_game(**options)
+    game = init(game_data["setup"])
+    process_events(game, game_data["events"])
+    exact = deal_probabilities(game)
+    estimates = None
+    for estimates in sample_probabilities(game, samples=samples, workers=workers, seed=0):
+        pass
+    if exact is None or estimates is None:
+        if exact is None and estimates is None:
+            return [], (0.0, "no consistent deal")
+        return ["deal"], (1.0, "only one of them found a consistent deal")
+
+    cells = [
+        (
+            abs(odds - estimates.player_probabilities[name][card]),
+            2 * estimates.player_intervals[name][card] + TOLERANCE,
+            f"{name} {card}",
+        )
+        for name, cards in exact.player_probabilities.items()
+        for card, odds in cards.items()
+    ]
+    cells += [
+        (
+            abs(odds - estimates.solution_probabilities[card]),
+            2 * estimates.solution_intervals[card] + TOLERANCE,
+            f"envelope {card}",
+        )
+        for card, odds in exact.solution_probabilities.items()
+    ]
+    failed = [cell for miss, allowed_miss, cell in cells if miss > allowed_miss]
+    miss, _, cell = max(cells)
+    return failed, (miss, cell)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="check the --sample estimates against the exact odds on small "
+        "generated games, exits with an error if any estimate is off"
+    )
+    parser.add_argument("--samples", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    failed = 0
+    for options in GAMES:
+        failed_cells, (miss, cell) = check_game(options, args.samples, args.workers)
+        failed += bool(failed_cells)
+        print(
+            f"{'FAIL' if failed_cells else 'ok  '} {options}: biggest miss {miss:.1%} "
+            f"on {cell}, {len(failed_cells)} cells off by more than allowed"
+        )
+    if failed:
+        raise SystemExit(f"{failed} of {len(GAMES)} games sampled wrongly")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
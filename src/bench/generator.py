@@ -0,0 +1,125 @@
+import random
+
+STANDARD_SUSPECTS = ["green", "mustard", "peacock", "plum", "scarlet", "white"]
+STANDARD_WEAPONS = ["candlestick", "dagger", "leadpipe", "revolver", "rope", "wrench"]
+STANDARD_ROOMS = [
+    "study",
+    "hall",
+    "lounge",
+    "library",
+    "billiard",
+    "dining",
+    "conservatory",
+    "ballroom",
+    "kitchen",
+]
+
+
+def section_cards(standard, prefix, count):
+    if count == len(standard):
+        return list(standard)
+    return [f"{prefix}{i:02}" for i in range(1, count + 1)]
+
+
+class Deal:
+    # the cards of a game, the envelope and every player's hand
+    def __init__(self, names, sections, solution, hands):
+        self.names = names
+        # suspect, weapon and room cards
+        self.sections = sections
+        self.solution = solution
+        self.hands = hands
+        self.owner = {card: name for name, hand in hands.items() for card in hand}
+        # the first player dealt at least one card
+        self.username = next(name for name in names if hands[name])
+
+    def setup(self, username):
+        # the setup section of game.yml as seen by username, who must have cards
+        setup = {"players": []}
+        for name in self.names:
+            if name == username:
+                setup["players"].append({"name": name, "cards": " ".join(self.hands[name])})
+            else:
+                setup["players"].append({"name": name, "card_count": len(self.hands[name])})
+        if self.sections != (STANDARD_SUSPECTS, STANDARD_WEAPONS, STANDARD_ROOMS):
+            suspect_cards, weapon_cards, room_cards = self.sections
+            setup["cards"] = {
+                "suspects": suspect_cards,
+                "weapons": weapon_cards,
+                "rooms": room_cards,
+            }
+        return setup
+
+
+def deal_game(rng, players=5, suspects=6, weapons=6, rooms=9):
+    suspect_cards = section_cards(STANDARD_SUSPECTS, "suspect", suspects)
+    weapon_cards = section_cards(STANDARD_WEAPONS, "weapon", weapons)
+    room_cards = section_cards(STANDARD_ROOMS, "room", rooms)
+    solution = (
+        rng.choice(suspect_cards),
+        rng.choice(weapon_cards),
+        rng.choice(room_cards),
+    )
+
+    names = [f"player{i}" for i in range(players)]
+    deck = [
+        card for card in suspect_cards + weapon_cards + room_cards if card not in solution
+    ]
+    rng.shuffle(deck)
+    hands = {name: deck[i::players] for i, name in enumerate(names)}
+    return Deal(names, (suspect_cards, weapon_cards, room_cards), solution, hands)
+
+
+def generate_game(
+    players=5,
+    suspects=6,
+    weapons=6,
+    rooms=9,
+    events=60,
+    seed=0,
+    reveal_rate=0.05,
+    accusation_rate=0.03,
+):
+    # a random but valid game as parsed from game.yml: the cards are dealt,
+    # then players take turns making suggestions that are answered truthfully
+    # by the first player in seating order holding one of the cards, with the
+    # odd reveal and failed accusation mixed in
+    rng = random.Random(seed)
+    deal = deal_game(rng, players, suspects, weapons, rooms)
+    setup = deal.setup(deal.username)
+    names = deal.names
+    owner = deal.owner
+    username = deal.username
+    solution = deal.solution
+    suspect_cards, weapon_cards, room_cards = deal.sections
+
+    game_events = []
+    turn = 0
+    while len(game_events) < events:
+        asker = names[turn % players]
+        turn += 1
+        roll = rng.random()
+        if roll < reveal_rate:
+            card = rng.choice(suspect_cards + weapon_cards + room_cards)
+            game_events.append({"r": f"{owner.get(card, 'nobody')} {card}"})
+            continue
+        cards = [rng.choice(suspect_cards), rng.choice(weapon_cards), rng.choice(room_cards)]
+        if roll < reveal_rate + accusation_rate:
+            if tuple(cards) != solution:
+                game_events.append({"accuse": f"{asker} {' '.join(cards)}"})
+            continue
+
+        answer = "nobody"
+        asker_index = names.index(asker)
+        for offset in range(1, players):
+            answerer = names[(asker_index + offset) % players]
+            held = [card for card in cards if owner.get(card) == answerer]
+            if held:
+                answer = answerer
+                if asker == username:
+                    answer += " " + rng.choice(held)
+                break
+        rng.shuffle(cards)
+        game_events.append({"q": f"{asker} {' '.join(cards)}", "a": answer})
+
+    return {"setup": setup, "events": game_events}
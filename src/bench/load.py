@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from urllib.parse import urlsplit
+
+from bench.generator import generate_game
+
+
+class Client:
+    # one keep alive http/1.1 connection to the game server
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b"" if payload is None else json.dumps(payload).encode()
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, await self.reader.readexactly(length)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[max(index, 0)]
+
+
+async def play(client, game_data, sheet_every, latencies, errors):
+    # create the game with no events, then post its events one by one like
+    # a table would, fetching the sheet every sheet_every events
+    async def timed(operation, method, path, payload=None):
+        start = time.perf_counter()
+        status, body = await client.request(method, path, payload)
+        latencies.setdefault(operation, []).append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append(f"{operation} {status} {body[:200].decode(errors='replace')}")
+        return body
+
+    body = await timed("create", "POST", "/games", {"setup": game_data["setup"]})
+    game_id = json.loads(body)["id"]
+    for index, event in enumerate(game_data["events"], 1):
+        await timed("event", "POST", f"/games/{game_id}/events?format=json", event)
+        if index % sheet_every == 0:
+            await timed("sheet", "GET", f"/games/{game_id}")
+
+
+async def run_load(args):
+    url = urlsplit(args.url)
+    games = [
+        generate_game(players=args.players, events=args.events, seed=args.seed + i)
+        for i in range(args.games)
+    ]
+    queue = asyncio.Queue()
+    for game_data in games:
+        queue.put_nowait(game_data)
+    latencies = {}
+    errors = []
+
+    async def worker():
+        client = Client(url.hostname, url.port or 80)
+        try:
+            while not queue.empty():
+                await play(client, queue.get_nowait(), args.sheet_every, latencies, errors)
+        finally:
+            client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    stats_client = Client(url.hostname, url.port or 80)
+    _, stats = await stats_client.request("GET", "/stats")
+    stats_client.close()
+    return elapsed, latencies, errors, json.loads(stats)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="replay generated games against a running server.py with many "
+        "concurrent connections and report throughput and latency"
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--events", type=int, default=60)
+    parser.add_argument("--players", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--sheet-every", type=int, default=5, help="fetch the sheet every N events"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this json file")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    elapsed, latencies, errors, server_stats = asyncio.run(run_load(args))
+
+    request_count = sum(len(values) for values in latencies.values())
+    results = {
+        "games": args.games,
+        "concurrency": args.concurrency,
+        "seconds": elapsed,
+        "requests": request_count,
+        "requests_per_second": request_count / elapsed,
+        "errors": len(errors),
+        "operations": {},
+        "server": server_stats,
+    }
+    print(
+        f"{request_count} requests in {elapsed:.2f}s "
+        f"({request_count / elapsed:.0f}/s), {len(errors)} errors"
+    )
+    for operation, values in latencies.items():
+        values.sort()
+        summary = {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.5) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+        results["operations"][operation] = summary
+        print(
+            f"{operation:<8}{summary['count']:>8} p50 {summary['p50_ms']:.2f}ms "
+            f"p99 {summary['p99_ms']:.2f}ms max {summary['max_ms']:.2f}ms"
+        )
+    print(f"server: {server_stats}")
+    for error in errors[:5]:
+        print(error, file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,353 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bench.generator import deal_game
+from bench.load import percentile
+from clue import init, process_events
+
+
+class RandomAgent:
+    # suggests random cards and accuses once its sheet is solved. before that
+    # it guesses on a guess_rate of its turns, naming cards that could still
+    # be the solution
+    kind = "random"
+
+    def __init__(self, name, setup, rng, guess_rate=0.0):
+        self.name = name
+        self.game = init(setup)
+        self.rng = rng
+        self.guess_rate = guess_rate
+        # events from this player's point of view, as in their game.yml
+        self.events = []
+        self.turns = 0
+        # out of the game after a wrong accusation, still answering suggestions
+        self.eliminated = False
+
+    def solution(self):
+        game = self.game
+        if not game.is_solved():
+            return None
+        return game.suspect_solution(), game.weapon_solution(), game.room_solution()
+
+    def accusation(self):
+        # the cards to accuse this turn, or None to make a suggestion
+        solution = self.solution()
+        if solution is not None or self.rng.random() >= self.guess_rate:
+            return solution
+        game = self.game
+        ruled_out = game.owned_mask | game.not_solution_mask
+        return tuple(
+            self.rng.choice(
+                [card for card in sorted(cards) if not ruled_out & game.card_bit(card)]
+            )
+            for cards in (game.SUSPECTS, game.WEAPONS, game.ROOMS)
+        )
+
+    def suggest(self):
+        game = self.game
+        return [
+            self.rng.choice(sorted(cards))
+            for cards in (game.SUSPECTS, game.WEAPONS, game.ROOMS)
+        ]
+
+    def observe(self, event, latencies):
+        start = time.perf_counter()
+        process_events(self.game, [event])
+        latencies.append(time.perf_counter() - start)
+        self.events.append(event)
+
+
+class BotAgent(RandomAgent):
+    # suggests, in every section still open, a card that could be the solution.
+    # in sections already solved it names a card nobody can show, one of its
+    # own or the solution, so the answer is about the open sections only
+    kind = "bot"
+
+    def accusation(self):
+        # never guesses
+        return self.solution()
+
+    def suggest(self):
+        game = self.game
+        me = game.get_player(self.name)
+        ruled_out = game.owned_mask | game.not_solution_mask
+        cards = []
+        for section_cards in (game.SUSPECTS, game.WEAPONS, game.ROOMS):
+            section_cards = sorted(section_cards)
+            solution = game.get_section_solution(section_cards)
+            if solution is None:
+                choices = [card for card in section_cards if not ruled_out & game.card_bit(card)]
+            else:
+                choices = [card for card in section_cards if me.has_mask & game.card_bit(card)]
+                choices = choices or [solution]
+            cards.append(self.rng.choice(choices))
+        return cards
+
+
+AGENTS = {agent.kind: agent for agent in (RandomAgent, BotAgent)}
+# suggestions, reveals and wrong accusations, as in game.yml
+EVENT_KINDS = ("q", "r", "accuse")
+
+
+def play_game(task):
+    # one game between the given agents, every player keeping their own sheet
+    # from the events they see. turns go round until a player accuses right.
+    # a wrong accusation is announced and puts the accuser out of the game,
+    # and on a reveal_rate of turns a card is shown to everyone outside a
+    # suggestion first, so every kind of event gets processed
+    seed, kinds, deck, max_turns, reveal_rate, guess_rate = task
+    rng = random.Random(seed)
+    deal = deal_game(rng, len(kinds), *deck)
+    agents = []
+    for name, kind in zip(deal.names, kinds):
+        if not deal.hands[name]:
+            raise Exception(f"{name} was dealt no cards, use fewer players")
+        agents.append(
+            AGENTS[kind](
+                name, deal.setup(name), random.Random(rng.getrandbits(64)), guess_rate
+            )
+        )
+
+    # inference time per event, by kind of event
+    latencies = {kind: [] for kind in EVENT_KINDS}
+    winner = None
+    turn = 0
+    while winner is None and turn < max_turns:
+        if all(agent.eliminated for agent in agents):
+            break
+        asker = agents[turn % len(agents)]
+        turn += 1
+        if asker.eliminated:
+            continue
+        asker.turns += 1
+        if rng.random() < reveal_rate:
+            holder = rng.choice(deal.names)
+            reveal = {"r": f"{holder} {rng.choice(deal.hands[holder])}"}
+            for agent in agents:
+                agent.observe(reveal, latencies["r"])
+
+        accusation = asker.accusation()
+        if accusation == deal.solution:
+            winner = asker
+            break
+        if accusation is not None:
+            if asker.game.is_solved():
+                raise Exception(f"{asker.name} accused {accusation} but it was {deal.solution}")
+            asker.eliminated = True
+            accuse = {"accuse": f"{asker.name} {' '.join(accusation)}"}
+            for agent in agents:
+                agent.observe(accuse, latencies["accuse"])
+            continue
+
+        cards = asker.suggest()
+        answerer = None
+        shown = None
+        asker_index = agents.index(asker)
+        for offset in range(1, len(agents)):
+            player = agents[(asker_index + offset) % len(agents)]
+            held = [card for card in cards if deal.owner.get(card) == player.name]
+            if held:
+                answerer = player.name
+                shown = rng.choice(held)
+                break
+        suggestion = f"{asker.name} {' '.join(cards)}"
+        for agent in agents:
+            if answerer is None:
+                answer = "nobody"
+            elif agent is asker:
+                answer = f"{answerer} {shown}"
+            else:
+                answer = answerer
+            agent.observe({"q": suggestion, "a": answer}, latencies["q"])
+
+    return {
+        "seed": seed,
+        "kinds": kinds,
+        "winner": None if winner is None else winner.kind,
+        "winner_seat": None if winner is None else agents.index(winner),
+        # the winner's own turns, including the one they accused on
+        "turns": None if winner is None else winner.turns,
+        "solved": [agent.game.is_solved() for agent in agents],
+        "eliminated": sum(agent.eliminated for agent in agents),
+        "latencies": latencies,
+        "setup": None if winner is None else deal.setup(winner.name),
+        "events": None if winner is None else winner.events,
+    }
+
+
+def distribution(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p10": percentile(values, 0.1),
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "max": values[-1],
+    }
+
+
+def latency_summary(latencies):
+    # sorted latencies in seconds, reported in microseconds
+    return {
+        "count": len(latencies),
+        "p50": percentile(latencies, 0.5) * 1e6,
+        "p99": percentile(latencies, 0.99) * 1e6,
+        "max": (latencies[-1] if latencies else 0) * 1e6,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="play many games between simulated players on a process pool "
+        "and report how many turns each kind of player takes to solve them and "
+        "how long inference takes per event"
+    )
+    parser.add_argument(
+        "--agents",
+        default="bot,random,random,random,random",
+        help=f"comma separated kinds of player per seat, of {', '.join(AGENTS)}. "
+        "seats are rotated between games",
+    )
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--suspects", type=int, default=6)
+    parser.add_argument("--weapons", type=int, default=6)
+    parser.add_argument("--rooms", type=int, default=9)
+    parser.add_argument(
+        "--max-turns", type=int, default=2000, help="give up on a game after N turns"
+    )
+    parser.add_argument(
+        "--reveal-rate",
+        type=float,
+        default=0.05,
+        help="chance per turn that a card is revealed to everyone outside a suggestion",
+    )
+    parser.add_argument(
+        "--guess-rate",
+        type=float,
+        default=0.005,
+        help="chance per turn that a random player accuses before solving their sheet",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="defaults to the number of cpus"
+    )
+    parser.add_argument("--output", help="also write the results to this json file")
+    parser.add_argument(
+        "--save-games",
+        metavar="DIR",
+        help="write every finished game to DIR as a game file seen by its winner",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    kinds = args.agents.split(",")
+    for kind in kinds:
+        if kind not in AGENTS:
+            raise SystemExit(f"unknown agent {kind}, expected one of {', '.join(AGENTS)}")
+    deck = (args.suspects, args.weapons, args.rooms)
+    tasks = []
+    for index in range(args.games):
+        rotation = index % len(kinds)
+        seating = kinds[rotation:] + kinds[:rotation]
+        tasks.append(
+            (
+                args.seed + index,
+                seating,
+                deck,
+                args.max_turns,
+                args.reveal_rate,
+                args.guess_rate,
+            )
+        )
+
+    if args.save_games:
+        os.makedirs(args.save_games, exist_ok=True)
+    turns = {kind: [] for kind in kinds}
+    wins = {kind: 0 for kind in kinds}
+    seats = {kind: kinds.count(kind) * args.games for kind in kinds}
+    latencies = {kind: [] for kind in EVENT_KINDS}
+    unfinished = 0
+    eliminated = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        for record in executor.map(play_game, tasks, chunksize=8):
+            for kind in EVENT_KINDS:
+                latencies[kind].extend(record["latencies"][kind])
+            eliminated += record["eliminated"]
+            if record["winner"] is None:
+                unfinished += 1
+                continue
+            wins[record["winner"]] += 1
+            turns[record["winner"]].append(record["turns"])
+            if args.save_games:
+                filename = os.path.join(args.save_games, f"game{record['seed']}.yml")
+                with open(filename, "w") as file:
+                    json.dump({"setup": record["setup"], "events": record["events"]}, file)
+    elapsed = time.perf_counter() - start
+
+    for kind in EVENT_KINDS:
+        latencies[kind].sort()
+    all_latencies = sorted(value for kind in EVENT_KINDS for value in latencies[kind])
+    results = {
+        "games": args.games,
+        "agents": kinds,
+        "deck": list(deck),
+        "seconds": elapsed,
+        "games_per_second": args.games / elapsed,
+        "unfinished": unfinished,
+        "eliminated": eliminated,
+        "kinds": {},
+        "event_latency_us": latency_summary(all_latencies),
+        "event_latency_us_by_kind": {
+            kind: latency_summary(latencies[kind]) for kind in EVENT_KINDS
+        },
+    }
+    print(
+        f"{args.games} games in {elapsed:.2f}s ({args.games / elapsed:.0f}/s), "
+        f"{unfinished} unfinished after {args.max_turns} turns or with every player "
+        f"out, {eliminated} players out after a wrong accusation"
+    )
+    for kind in dict.fromkeys(kinds):
+        summary = distribution(turns[kind])
+        summary["win_rate_per_seat"] = wins[kind] / seats[kind]
+        results["kinds"][kind] = summary
+        if summary["count"]:
+            print(
+                f"{kind:<8}won {wins[kind]:>6} ({summary['win_rate_per_seat']:.1%} per seat), "
+                f"turns to solve mean {summary['mean']:.1f} p10 {summary['p10']} "
+                f"p50 {summary['p50']} p90 {summary['p90']} max {summary['max']}"
+            )
+        else:
+            print(f"{kind:<8}won      0")
+    latency = results["event_latency_us"]
+    print(
+        f"inference per event over {latency['count']} events: p50 {latency['p50']:.0f}us "
+        f"p99 {latency['p99']:.0f}us max {latency['max']:.0f}us"
+    )
+    for kind, latency in results["event_latency_us_by_kind"].items():
+        print(
+            f"  {kind:<8}{latency['count']:>8} events: p50 {latency['p50']:.0f}us "
+            f"p99 {latency['p99']:.0f}us max {latency['max']:.0f}us"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
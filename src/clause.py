@@ -0,0 +1,17 @@
+class Clause:
+    # an answered suggestion: the answerer has at least one of the three
+    # cards. two cards that are not ruled out are watched, the clause is only
+    # looked at again when one of those is ruled out for the answerer
+    __slots__ = ("suggestion", "bits", "mask", "event", "index", "watched")
+
+    def __init__(self, suggestion, bits, event, index):
+        self.suggestion = suggestion
+        self.bits = bits
+        self.mask = bits[0] | bits[1] | bits[2]
+        # number of the event that answered the suggestion
+        self.event = event
+        # position in player.clauses
+        self.index = index
+        # the two watched card bits, empty once the clause forced a card or
+        # the answerer was found to hold one of its cards
+        self.watched = ()
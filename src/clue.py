@@ -1,76 +1,142 @@
-import yaml
+import copy
 import os
 import logging
+import hashlib
+import json
+import pickle
 
-from suggestion import Suggestion
-from game import Game
+from suggestion import make_suggestion
+from game import Contradiction, Game, iter_bits
 from player import Player
+from render import default_renderer
+from tables import Table, TableView, is_game_file
+from profiling import Profiler
+from provenance import (
+    COULD_NOT_ANSWER,
+    DEALT,
+    FAILED_ACCUSATION,
+    LAST_CARD_IN_SECTION,
+    ONLY_POSSIBLE_OWNER,
+    REVEALED,
+    RULE_DESCRIPTIONS,
+    SHOWN,
+)
+from gamefile import GameFile, cache_filename, open_private, parse_event
 import time
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+import shutil
 import sys
+import threading
+import argparse
+from contextlib import contextmanager, nullcontext
 
-
-# Set up the logger
-logging.basicConfig(level=logging.DEBUG, format="%(levelname)s - %(message)s")
+# set by enable_profiling
+profiler = None
 
 
 def parse_suggestion(game, suggestion_data):
-    elements = suggestion_data.split()
-    if len(elements) != 4:
-        raise Exception("invalid suggestion: " + suggestion_data)
+    return make_suggestion(*parse_suggestion_cards(game, suggestion_data))
 
-    player_name = elements[0]
-    if player_name not in [player.name for player in game.players]:
-        raise Exception("invalid player name: " + player_name)
 
-    cards = elements[1:]
-    suggestion = Suggestion(player_name)
-    for card in cards:
-        if card in game.SUSPECTS:
-            suggestion.suspect = card
-        elif card in game.WEAPONS:
-            suggestion.weapon = card
-        elif card in game.ROOMS:
-            suggestion.room = card
+def parse_suggestion_cards(game, suggestion_data):
+    # (player name, suspect, weapon, room) of a suggestion from game.yml
+    with game.profiler.phase("parse_suggestion"):
+        elements = suggestion_data.split()
+        if len(elements) != 4:
+            raise Exception("invalid suggestion: " + suggestion_data)
+
+        player_name = elements[0]
+        if player_name not in [player.name for player in game.players]:
+            raise Exception("invalid player name: " + player_name)
+
+        cards = elements[1:]
+        suspect = weapon = room = None
+        for card in cards:
+            if card in game.SUSPECTS:
+                suspect = card
+            elif card in game.WEAPONS:
+                weapon = card
+            elif card in game.ROOMS:
+                room = card
+            else:
+                raise Exception("invalid card: " + card)
+
+        if suspect is None or weapon is None or room is None:
+            raise Exception(
+                f"Invalid suggestion '{suggestion_data}'. Please include one suspect, one weapon, and one room."
+            )
         else:
-            raise Exception("invalid card: " + card)
-
-    if (
-        suggestion.suspect is None
-        or suggestion.weapon is None
-        or suggestion.room is None
-    ):
-        raise Exception(
-            f"Invalid suggestion '{suggestion_data}'. Please include one suspect, one weapon, and one room."
-        )
+            return player_name, suspect, weapon, room
+
+
+def card_id(game, card):
+    # index of the card in game.cards_by_index
+    bit = game.card_bit(card)
+    if bit == 0:
+        raise Exception("invalid card: " + card)
+    return bit.bit_length() - 1
+
+
+def compile_event(game, event):
+    # validate an event from game.yml and intern its names, players to their
+    # index in game.players and cards to their index in game.cards_by_index:
+    #   ("q", asker, suspect, weapon, room, answerer or None, shown card or None)
+    #   ("r", player or None, card)
+    #   ("accuse", accuser, suspect, weapon, room)
+    if "q" in event:
+        suggestion_cards = parse_suggestion_cards(game, event["q"])
+        answer_data = event["a"].split()
+        answerer = None
+        shown = None
+        if answer_data[0] != "nobody":
+            answerer = game.get_player(answer_data[0]).index
+            if len(answer_data) > 1:
+                shown = card_id(game, answer_data[1])
+        return ("q", *compile_suggestion(game, suggestion_cards), answerer, shown)
+    elif "r" in event:
+        player_name, card = event["r"].split()
+        player = None if player_name == "nobody" else game.get_player(player_name).index
+        return ("r", player, card_id(game, card))
+    elif "accuse" in event:
+        return ("accuse", *compile_suggestion(game, parse_suggestion_cards(game, event["accuse"])))
     else:
-        return suggestion
+        raise Exception(f"invalid event: {event}")
+
+
+def compile_suggestion(game, suggestion_cards):
+    player_name, suspect, weapon, room = suggestion_cards
+    return (
+        game.get_player(player_name).index,
+        card_id(game, suspect),
+        card_id(game, weapon),
+        card_id(game, room),
+    )
+
 
+def compiled_suggestion(game, compiled):
+    asker, suspect, weapon, room = compiled[1:5]
+    cards = game.cards_by_index
+    return make_suggestion(
+        game.players[asker].name, cards[suspect], cards[weapon], cards[room]
+    )
 
-def process_suggestion(game, suggestion_data):
-    suggestion = parse_suggestion(game, suggestion_data["q"])
-    logging.debug(f"processing suggestion: {suggestion}")
-    answer_data = suggestion_data["a"].split()
-    answerer_name = answer_data[0]
-    logging.debug(f"suggestion answered by: {answerer_name}")
 
-    if answerer_name == "nobody":
+def process_suggestion(game, suggestion, answerer_index, shown):
+    logging.debug("processing suggestion: %s", suggestion)
+    guesser = game.get_player(suggestion.player_name)
+
+    if answerer_index is None:
+        logging.debug("suggestion answered by: nobody")
+        could_not_answer = game.reason(COULD_NOT_ANSWER)
         for player in game.players:
             if player.name != suggestion.player_name:
-                player.does_not_have_suggestion(suggestion)
+                player.does_not_have_suggestion(suggestion, could_not_answer)
         # the suggester could have all or none of the suggested cards
         # unfortunately you can't infer anything from this
-        guesser = game.get_player(suggestion.player_name)
-        guesser.made_suggestion_with_no_answer.append(suggestion)
+        guesser.add_suggestion_with_no_answer(suggestion)
     else:
-        answerer = game.get_player(answerer_name)
-        if answerer is None:
-            raise Exception(f"Player {answerer_name} not found.")
-        guesser = game.get_player(suggestion.player_name)
-        guesser_index = game.players.index(guesser)
-        # get index of player who showed the card
-        answerer_index = game.players.index(answerer)
+        answerer = game.players[answerer_index]
+        logging.debug("suggestion answered by: %s", answerer.name)
+        guesser_index = guesser.index
 
         # get all players between the guesser and the player who showed the card
         if guesser_index != answerer_index:
@@ -81,57 +147,69 @@ def process_suggestion(game, suggestion_data):
                 players_between += game.players[guesser_index + 1 :]
         else:
             players_between = []
-        logging.debug(
-            f"players: {[player_between.name for player_between in players_between]} do not have the cards: {suggestion.suspect}, {suggestion.weapon}, {suggestion.room}"
-        )
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(
+                f"players: {[player_between.name for player_between in players_between]} do not have the cards: {suggestion.suspect}, {suggestion.weapon}, {suggestion.room}"
+            )
 
         # record that the players between do not have the cards in the suggestion
+        could_not_answer = game.reason(COULD_NOT_ANSWER)
         for player_between in players_between:
-            player_between.does_not_have_suggestion(suggestion)
+            player_between.does_not_have_suggestion(suggestion, could_not_answer)
 
-        if len(answer_data) > 1:
-            logging.debug(
-                f"recording that answerer {answerer.name} has card: {answer_data[1]}"
-            )
-            answerer.add_card(answer_data[1])
+        if shown is not None:
+            card = game.cards_by_index[shown]
+            logging.debug("recording that answerer %s has card: %s", answerer.name, card)
+            answerer.add_card(card, game.reason(SHOWN))
         else:
             # record that the player who showed the card has the suggestion
-            answerer.answered_suggestions.append(suggestion)
-
-        return suggestion, answerer
-
+            answerer.add_answered_suggestion(suggestion, game.events_applied)
 
-def process_reveal(game, reveal):
-    player_name, card = reveal["r"].split()
-    logging.debug(f"{player_name} has {card}")
 
-    if player_name != "nobody":
-        game.get_player(player_name).add_card(card)
+def process_reveal(game, player_index, card):
+    if player_index is not None:
+        player = game.players[player_index]
+        logging.debug("%s has %s", player.name, card)
+        player.add_card(card, game.reason(REVEALED))
     else:
+        logging.debug("nobody has %s", card)
+        revealed = game.reason(REVEALED)
         for player in game.players:
-            player.does_not_have_card(card)
+            player.does_not_have_card(card, revealed)
 
 
-def check_for_completed_section(game, gamecards, get_player_cards):
+def check_for_completed_section(game, section_mask):
     # if all cards but one are known in a section
     # then we know that card is in the file
-    known_cards = []
-    for player in game.players:
-        known_cards.extend(get_player_cards(player))
-        known_cards.extend(game.not_solution_cards)
+    with game.profiler.rule("check_for_completed_sections", game):
+        known_mask = game.not_solution_mask | game.owned_mask
 
-    remaining_unknown = [card for card in gamecards if card not in known_cards]
+        remaining_unknown = section_mask & ~known_mask
 
-    if len(remaining_unknown) == 1:
-        # found answer
-        for player in game.players:
-            player.does_not_have_card(remaining_unknown[0])
+        if not remaining_unknown:
+            raise Contradiction(
+                f"every one of {game.cards_str(section_mask)} is held or ruled out, "
+                "none is left for the solution"
+            )
+        if remaining_unknown.bit_count() == 1:
+            # found answer
+            premises = []
+            for bit in iter_bits(section_mask & ~remaining_unknown):
+                owners = game.card_owners[bit.bit_length() - 1]
+                if owners:
+                    owner = game.players[owners.bit_length() - 1]
+                    premises += game.fact_ids(owner, bit, True)
+                else:
+                    premises += game.fact_ids(None, bit, False)
+            reason = game.reason(LAST_CARD_IN_SECTION, premises)
+            for player in game.players:
+                player.does_not_have_any(remaining_unknown, reason)
 
 
 def check_for_completed_sections(game):
-    check_for_completed_section(game, game.WEAPONS, lambda p: p.weapons)
-    check_for_completed_section(game, game.ROOMS, lambda p: p.rooms)
-    check_for_completed_section(game, game.SUSPECTS, lambda p: p.suspects)
+    check_for_completed_section(game, game.weapons_mask)
+    check_for_completed_section(game, game.rooms_mask)
+    check_for_completed_section(game, game.suspects_mask)
 
 
 def check_for_infer_section(game, section_cards, section_solution):
@@ -150,14 +228,25 @@ def check_for_infer_section(game, section_cards, section_solution):
 
     # if the unknown cards are unique
     for card in section_cards:
-        players_for_which_card_is_unknown = [
-            player for player in game.players if player.is_unknown_card(card)
-        ]
-        if len(players_for_which_card_is_unknown) == 1:
-            logging.debug(
-                f"only {players_for_which_card_is_unknown[0].name} could have card {card}"
-            )
-            players_for_which_card_is_unknown[0].add_card(card)
+        check_for_infer_card(game, card)
+
+
+def check_for_infer_card(game, card):
+    with game.profiler.rule("check_for_infer_sections", game):
+        unknown_players = game.unknown_players_mask(game.card_bit(card))
+        # exactly one player for which the card is unknown
+        if unknown_players and not unknown_players & (unknown_players - 1):
+            player = game.players[unknown_players.bit_length() - 1]
+            logging.debug("only %s could have card %s", player.name, card)
+            bit = game.card_bit(card)
+            premises = []
+            for other_player in game.players:
+                if other_player is not player:
+                    premises += game.fact_ids(other_player, bit, False)
+            solution_mask = game.nobody_has_mask() & game.section_mask(bit)
+            if solution_mask:
+                premises += game.nobody_has_fact_ids(solution_mask)
+            player.add_card(card, game.reason(ONLY_POSSIBLE_OWNER, premises))
 
 
 def check_for_infer_sections(game):
@@ -167,62 +256,284 @@ def check_for_infer_sections(game):
 
 
 def check_for_infer_accusation(game):
-    sol_weapon = game.weapon_solution()
-    sol_suspect = game.suspect_solution()
-    sol_room = game.room_solution()
+    with game.profiler.rule("check_for_infer_accusation", game):
+        sol_weapon = game.weapon_solution()
+        sol_suspect = game.suspect_solution()
+        sol_room = game.room_solution()
+
+        def reason(event, solution_cards):
+            premises = []
+            for card in solution_cards:
+                premises += game.nobody_has_fact_ids(game.card_bit(card))
+            return game.reason(FAILED_ACCUSATION, premises, event)
+
+        # todo early return
+        for accusation, event in zip(game.accusations, game.accusation_events):
+            if accusation.suspect == sol_suspect and accusation.weapon == sol_weapon:
+                # know accusation.room is not correct:
+                game.add_not_solution(
+                    accusation.room, reason(event, (sol_suspect, sol_weapon))
+                )
+            elif accusation.suspect == sol_suspect and accusation.room == sol_room:
+                game.add_not_solution(
+                    accusation.weapon, reason(event, (sol_suspect, sol_room))
+                )
+            elif accusation.room == sol_room and accusation.weapon == sol_weapon:
+                game.add_not_solution(
+                    accusation.suspect, reason(event, (sol_room, sol_weapon))
+                )
+
+
+def review_all_rules(game):
+    for player in game.players:
+        # e.g. player responds to A B C but not X B C then player has A
+        player.review_all_clauses()
+        # e.g. if player only has 1 card remaining & it could only be 1 card
+        player.check_number_of_remaining_against_number_of_unknown()
+
+    # sort of weird case where it's obvious where a card is when you already know the section solution,
+    # and is only required to decrement the card count for a player
+    check_for_infer_sections(game)
+
+    # check for single missing answer
+    check_for_completed_sections(game)
+
+    # if accusation is A,B,C and confirmed B and C are solutions, then A is not the solution
+    check_for_infer_accusation(game)
+
 
-    # todo early return
-    for accusation in game.accusations:
-        if accusation.suspect == sol_suspect and accusation.weapon == sol_weapon:
-            # know accusation.room is not correct:
-            game.add_not_solution(accusation.room)
-        elif accusation.suspect == sol_suspect and accusation.room == sol_room:
-            game.add_not_solution(accusation.weapon)
-        elif accusation.room == sol_room and accusation.weapon == sol_weapon:
-            game.add_not_solution(accusation.suspect)
+def on_card_ruled_out(game, bit):
+    section_mask = game.section_mask(bit)
+    solution_mask = game.nobody_has_mask() & section_mask
+    if solution_mask & bit and not game.solution_found_mask & bit:
+        # nobody has this card so it is the section solution, which unlocks
+        # the section inference for every card and the accusation check
+        game.solution_found_mask |= bit
+        check_for_infer_section(game, game.cards_in(section_mask), game.card_name(bit))
+        check_for_infer_accusation(game)
+    elif solution_mask:
+        check_for_infer_card(game, game.card_name(bit))
+
+
+def propagate(game):
+    # work through newly learned facts until nothing new can be inferred,
+    # running only the rules that depend on the player or card of each fact.
+    # returns the number of facts processed
+    fact_count = 0
+    with game.profiler.phase("propagate"):
+        if game.needs_full_review:
+            game.needs_full_review = False
+            review_all_rules(game)
+
+        while game.pending_facts:
+            player, mask, has = game.pending_facts.popleft()
+            fact_count += 1
+            if player is None:
+                # cards that are not the solution count towards a completed section
+                for bit in iter_bits(mask):
+                    check_for_completed_section(game, game.section_mask(bit))
+                continue
+
+            player.check_number_of_remaining_against_number_of_unknown()
+            if has:
+                check_for_completed_section(game, game.section_mask(mask))
+            else:
+                player.review_clauses_watching(mask)
+                for bit in iter_bits(mask):
+                    on_card_ruled_out(game, bit)
+    game.facts_processed += fact_count
+    game.profiler.record_propagation(fact_count)
+    return fact_count
 
 
 def process_events(game, events):
+    # returns the compiled events, which apply_events can replay without
+    # parsing or validating them again
+    compiled_events = []
     for event in events:
-        if "q" in event:
-            process_suggestion(game, event)
-        elif "r" in event:
-            process_reveal(game, event)
-        elif "accuse" in event:
-            game.add_failed_accusation(parse_suggestion(game, event["accuse"]))
-        else:
-            raise Exception("invalid event: " + event)
+        compiled = compile_event(game, event)
+        try:
+            apply_event(game, compiled)
+        except Contradiction as e:
+            raise Contradiction(
+                f"event {game.events_applied} ({describe_event(event)}) contradicts "
+                f"the events before it: {e}"
+            ) from None
+        compiled_events.append(compiled)
+    return compiled_events
 
-        while True:
-            last_state = str(game)
-            for player in game.players:
-                # e.g. player responds to A B C but not X B C then player has A
-                player.review_suggestions_for_inferrable_cards()
-                # e.g. if player only has 1 card remaining & it could only be 1 card
-                player.check_number_of_remaining_against_number_of_unknown()
 
-            # sort of weird case where it's obvious where a card is when you already know the section solution,
-            # and is only required to decrement the card count for a player
-            check_for_infer_sections(game)
+def describe_event(event):
+    return ", ".join(f"{key}: {value}" for key, value in event.items())
+
 
-            # check for single missing answer
-            check_for_completed_sections(game)
+def describe_compiled_event(game, compiled):
+    # a compiled event back in the words of game.yml
+    players = game.players
+    cards = game.cards_by_index
+    kind = compiled[0]
+    if kind == "r":
+        _, player, card = compiled
+        name = "nobody" if player is None else players[player].name
+        return f"r: {name} {cards[card]}"
+    asker, suspect, weapon, room = compiled[1:5]
+    suggestion = f"{players[asker].name} {cards[suspect]} {cards[weapon]} {cards[room]}"
+    if kind == "accuse":
+        return f"accuse: {suggestion}"
+    answerer, shown = compiled[5:]
+    answer = "nobody" if answerer is None else players[answerer].name
+    if shown is not None:
+        answer += f" {cards[shown]}"
+    return f"q: {suggestion}, a: {answer}"
 
-            # if accusation is A,B,C and confirmed B and C are solutions, then A is not the solution
-            check_for_infer_accusation(game)
 
-            cur_state = str(game)
-            if last_state == cur_state:
-                break
+def fact_str(game, fact_id):
+    provenance = game.provenance
+    card = game.cards_by_index[provenance.cards[fact_id]]
+    row = provenance.players[fact_id]
+    if row == len(game.players):
+        statement = f"{card} is not the solution"
+    elif provenance.has[fact_id]:
+        statement = f"{game.players[row].name} has {card}"
+    else:
+        statement = f"{game.players[row].name} does not have {card}"
+    event = provenance.events[fact_id]
+    if event == 0:
+        source = "setup"
+    else:
+        source = f"event {event}: {describe_compiled_event(game, game.event_log[event - 1])}"
+    return f"{statement}, {RULE_DESCRIPTIONS[provenance.rules[fact_id]]} ({source})"
+
+
+def explain(game, player_name, card):
+    # how the sheet knows whether the player has the card: the fact and,
+    # indented below it, the facts it was derived from. a fact reached again
+    # is not expanded twice
+    player = game.get_player(player_name)
+    bit = game.card_bit(card)
+    if bit == 0:
+        raise Exception("invalid card: " + card)
+    has = bool(player.has_mask & bit)
+    if not has and not player.does_not_have_mask & bit:
+        return f"nothing is known yet about whether {player_name} has {card}\n"
+
+    ret = ""
+    expanded = set()
+    stack = [(game.fact_ids(player, bit, has)[0], 0)]
+    while stack:
+        fact_id, depth = stack.pop()
+        ret += "  " * depth + fact_str(game, fact_id)
+        if fact_id in expanded:
+            ret += " (see above)\n"
+            continue
+        ret += "\n"
+        expanded.add(fact_id)
+        for premise in reversed(game.provenance.premises_of(fact_id)):
+            stack.append((premise, depth + 1))
+    return ret
+
+
+def apply_events(game, compiled_events):
+    for compiled in compiled_events:
+        apply_event(game, compiled)
+
+
+def apply_event(game, compiled):
+    game.record_event(compiled)
+    game.events_applied += 1
+    kind = compiled[0]
+    if kind == "q":
+        process_suggestion(game, compiled_suggestion(game, compiled), *compiled[5:])
+    elif kind == "r":
+        process_reveal(game, compiled[1], game.cards_by_index[compiled[2]])
+    else:
+        game.add_failed_accusation(compiled_suggestion(game, compiled), game.events_applied)
+        check_for_infer_accusation(game)
+
+    propagate(game)
+
+
+def undo_events(game, count):
+    # take back the last count events, returns them compiled so they can be
+    # applied again. past the undo window the events before them are
+    # replayed from the first snapshot instead. the facts kept are explained
+    # as in a fresh replay, but clause watches are not taken back, so facts
+    # learned from events applied afterwards may be explained by another
+    # valid derivation than a fresh replay would give
+    count = min(count, game.events_applied)
+    if count == 0:
+        return []
+    kept = game.events_applied - count
+    undone = game.event_log.events(kept)
+    snapshot = game.snapshot_before(kept)
+    if snapshot is not None:
+        game.restore(snapshot)
+    else:
+        replayed = game.event_log.events(0, kept)
+        game.restore(game.first_snapshot)
+        apply_events(game, replayed)
+    return undone
+
+
+@contextmanager
+def what_if(game, undo=0, events=()):
+    # the game with its last undo events taken back and events applied on
+    # top, put back as it was afterwards. only what changed is redone, and
+    # the records of why the redone facts were learned are put back too, as
+    # redoing may derive them another way, see undo_events
+    provenance = copy.deepcopy(game.provenance) if undo else None
+    undone = undo_events(game, undo)
+    snapshot = game.snapshot()
+    try:
+        process_events(game, events)
+        yield game
+    finally:
+        game.restore(snapshot)
+        apply_events(game, undone)
+        if provenance is not None and len(provenance) == len(game.provenance):
+            game.provenance = provenance
+
+
+def what_if_str(undo, events):
+    ret = "\nWHAT IF:\n"
+    if undo:
+        ret += f"  the last {undo} events were taken back\n"
+    for event in events:
+        ret += f"  {describe_event(event)}\n"
+    return ret
+
+
+def enable_profiling(new_profiler):
+    # games made by init from now on report their rules to new_profiler, see
+    # Game.profiler. without it the rules report to a profiler that does
+    # nothing
+    global profiler
+    profiler = new_profiler
+
+
+def profile_phase(name):
+    return nullcontext() if profiler is None else profiler.phase(name)
+
+
+def write_profile(options):
+    report = profiler.report_json() if options.profile == "json" else profiler.report_table()
+    if options.profile_output:
+        with open(options.profile_output, "w") as file:
+            file.write(report)
+    else:
+        print(report, file=sys.stderr)
 
 
 def init(game_setup):
     game = Game()
+    if profiler is not None:
+        game.profiler = profiler
     if "cards" in game_setup:
         # overwrite cards
         game.SUSPECTS = set(game_setup["cards"]["suspects"])
         game.WEAPONS = set(game_setup["cards"]["weapons"])
         game.ROOMS = set(game_setup["cards"]["rooms"])
+        game.index_cards()
 
     cards = None
     player_with_cards = None
@@ -239,44 +550,513 @@ def init(game_setup):
 
     player_with_cards.card_count = len(cards)
     for card in cards:
-        player_with_cards.add_card(card)
+        player_with_cards.add_card(card, game.reason(DEALT))
     return game
 
 
-def run(filename):
-    with open(filename, "r") as file:
-        # clear console
-        os.system("cls" if os.name == "nt" else "clear")
+def fingerprint(data, previous=""):
+    # stable hash of parsed yaml, optionally chained onto a previous hash
+    encoded = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1((previous + encoded).encode()).hexdigest()
+
+
+CHECKPOINT_VERSION = 10
+
+
+class GameSession:
+    # keeps the inferred game in memory between file changes so that
+    # appending events only processes the new ones
+
+    def __init__(self, filename, checkpoint=True):
+        self.filename = filename
+        # kept with the compiled cache, the checkpoint is a pickle and only
+        # ever loaded from a directory nobody else can write to
+        self.checkpoint_filename = cache_filename(filename, "checkpoint")
+        self.checkpoint = checkpoint and self.checkpoint_filename is not None
+        self.game = None
+        self.setup_fingerprint = None
+        # event_fingerprints[i] is the chained hash of events[0..i]
+        self.event_fingerprints = []
+        self.compiled_events = []
+        if self.checkpoint:
+            self.load_checkpoint()
+
+    def reset(self):
+        self.game = None
+        self.setup_fingerprint = None
+        self.event_fingerprints = []
+        self.compiled_events = []
+
+    def update(self, data, compiled_events=None):
+        # compiled_events, if known, are the compiled form of data["events"]
+        setup_fingerprint = fingerprint(data["setup"])
+        events = data["events"]
+        processed = len(self.event_fingerprints)
+        if (
+            self.game is None
+            or setup_fingerprint != self.setup_fingerprint
+            or len(events) < processed
+            or (
+                processed > 0
+                and self._prefix_fingerprint(events, processed)
+                != self.event_fingerprints[-1]
+            )
+        ):
+            logging.debug("setup or earlier event changed, rebuilding game")
+            self.reset()
+            self.game = init(data["setup"])
+            self.setup_fingerprint = setup_fingerprint
+            processed = 0
+
+        try:
+            previous = self.event_fingerprints[-1] if self.event_fingerprints else ""
+            for index in range(processed, len(events)):
+                snapshot = self.game.snapshot()
+                event = events[index]
+                if compiled_events is None:
+                    self.compiled_events += process_events(self.game, [event])
+                else:
+                    apply_event(self.game, compiled_events[index])
+                    self.compiled_events.append(compiled_events[index])
+                previous = fingerprint(event, previous)
+                self.event_fingerprints.append(previous)
+        except Exception:
+            # drop what the failed event half applied, the events before it
+            # are kept
+            self.game.restore(snapshot)
+            raise
+
+        if self.checkpoint and len(events) > processed:
+            self.save_checkpoint()
+        return self.game
+
+    def _prefix_fingerprint(self, events, count):
+        previous = ""
+        for event in events[:count]:
+            previous = fingerprint(event, previous)
+        return previous
+
+    def save_checkpoint(self):
+        state = (
+            CHECKPOINT_VERSION,
+            self.game,
+            self.setup_fingerprint,
+            self.event_fingerprints,
+            self.compiled_events,
+        )
+        temp_filename = self.checkpoint_filename + ".tmp"
+        with open_private(temp_filename, "wb") as file:
+            pickle.dump(state, file)
+        os.replace(temp_filename, self.checkpoint_filename)
+
+    def load_checkpoint(self):
         try:
-            data = yaml.safe_load(file)
-            game = init(data["setup"])
-            process_events(game, data["events"])
-            print(game)
-        except Exception as e:
-            print("waiting for valid game.yml")
-            print(f"latest error: {e}")
-
-
-class FileChangeHandler(FileSystemEventHandler):
-    def __init__(self, filename) -> None:
-        super().__init__()
+            with open(self.checkpoint_filename, "rb") as file:
+                (
+                    version,
+                    game,
+                    setup_fingerprint,
+                    event_fingerprints,
+                    compiled_events,
+                ) = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return
+        if version != CHECKPOINT_VERSION:
+            return
+        if profiler is not None:
+            game.profiler = profiler
+        self.game = game
+        self.setup_fingerprint = setup_fingerprint
+        self.event_fingerprints = event_fingerprints
+        self.compiled_events = compiled_events
+
+
+class Cancelled(Exception):
+    # a newer save made the recompute in progress stale, see FileChangeHandler
+    pass
+
+
+def check_cancelled(cancelled):
+    if cancelled is not None and cancelled():
+        raise Cancelled()
+
+
+def display(game, options, renderer, footer="", cancelled=None):
+    # the sampler and the recommendations start process pools, their modules
+    # are only imported when asked for
+    if options.recommend:
+        from recommend import recommend_suggestions, recommendations_str
+
+        footer += recommendations_str(
+            recommend_suggestions(game, top=options.recommend, workers=options.workers)
+        )
+    if options.sample:
+        from sampling import sample_probabilities
+
+        # redraw the sheet each time the sampler refines its estimates
+        drawn = False
+        for estimates in sample_probabilities(
+            game, samples=options.samples, seconds=options.seconds, workers=options.workers
+        ):
+            check_cancelled(cancelled)
+            renderer.draw_text(f"{game.probability_str(estimates)}\n{estimates}\n{footer}")
+            drawn = True
+        if not drawn:
+            renderer.draw_text(game.probability_str(None) + footer)
+    elif options.probabilities:
+        game.view = "probability"
+        renderer.draw_text(str(game) + footer)
+    else:
+        game.view = "sheet"
+        renderer.draw_game(game, footer)
+
+
+def load_game(filename, session=None, cancelled=None):
+    # the game in filename, from the compiled cache when it is up to date.
+    # with a session only the events added since its last update are applied
+    game_file = GameFile(filename)
+    with profile_phase("yaml_load"):
+        data, compiled_events = game_file.load()
+    check_cancelled(cancelled)
+    if session is None:
+        game = init(data["setup"])
+        if compiled_events is None:
+            game_file.save_cache(data, process_events(game, data["events"]))
+        else:
+            apply_events(game, compiled_events)
+    else:
+        game = session.update(data, compiled_events)
+        if compiled_events is None:
+            game_file.save_cache(data, session.compiled_events)
+    return game
+
+
+def run(filename, session=None, options=None, renderer=None, cancelled=None):
+    # cancelled, if given, is checked between the phases and raises Cancelled
+    # once it returns true, the sheet is then left as it was
+    if options is None:
+        options = parse_args([filename])
+    if renderer is None:
+        renderer = default_renderer()
+    if profiler is not None:
+        profiler.reset()
+    try:
+        game = load_game(filename, session, cancelled)
+        footer = ""
+        if options.undo or options.what_if:
+            events = [parse_event(text) for text in options.what_if]
+            footer = what_if_str(options.undo, events)
+            hypothetical = what_if(game, options.undo, events)
+        else:
+            hypothetical = nullcontext()
+        check_cancelled(cancelled)
+        with hypothetical, profile_phase("render"):
+            if options.explain:
+                footer += "\n" + explain(game, *options.explain)
+            display(game, options, renderer, footer, cancelled)
+    except Cancelled:
+        raise
+    except Exception as e:
+        renderer.draw_text(f"waiting for valid game.yml\nlatest error: {e}")
+    if profiler is not None:
+        write_profile(options)
+
+
+def stream_events(filename, source, options, renderer):
+    # start from the game file, then apply events streamed from stdin or a
+    # unix socket as they arrive. the game file is not modified
+    import asyncio
+
+    from stream import EventStream
+
+    data, compiled_events = GameFile(filename).load()
+    game = init(data["setup"])
+    if compiled_events is None:
+        process_events(game, data.get("events") or [])
+    else:
+        apply_events(game, compiled_events)
+
+    # besides events, {"undo": N} takes back the last N events and
+    # {"what-if": event or [events]} shows them applied until the next record
+    hypothetical_events = []
+    # records are handled on the event loop and the sheet drawn on a thread,
+    # which holds this while it copies the game
+    lock = threading.Lock()
+
+    def handle_record(record):
+        # returns whether the record was an event
+        with lock:
+            if "what-if" in record:
+                events = record["what-if"]
+                events = events if isinstance(events, list) else [events]
+                with what_if(game, 0, events):
+                    pass
+                hypothetical_events[:] = events
+                return False
+            hypothetical_events.clear()
+            if "undo" in record:
+                count = 1 if record["undo"] is None else int(record["undo"])
+                if count < 1:
+                    raise Exception(f"undo takes a number of events of at least 1, not {count}")
+                undo_events(game, count)
+                return False
+            snapshot = game.snapshot()
+            try:
+                process_events(game, [record])
+            except Exception:
+                # drop what the rejected event half applied
+                game.restore(snapshot)
+                raise
+            return True
+
+    def draw(footer):
+        # a copy is drawn so that records keep being applied meanwhile
+        with lock:
+            shown = pickle.loads(pickle.dumps(game, pickle.HIGHEST_PROTOCOL))
+            events = list(hypothetical_events)
+        if events:
+            footer += what_if_str(0, events)
+        with what_if(shown, 0, events), profile_phase("render"):
+            display(shown, options, renderer, footer)
+        if profiler is not None:
+            with lock:
+                write_profile(options)
+
+    try:
+        asyncio.run(EventStream(handle_record, draw).serve(source))
+    except KeyboardInterrupt:
+        pass
+
+
+class FileChangeHandler:
+    # a watchdog event handler, watchdog is only imported by start_watcher.
+    # editors fire several events per save, so changes are coalesced: the
+    # sheet is recomputed on a worker thread once the file has been quiet for
+    # debounce seconds, or max_delay seconds after the first change not yet
+    # handled if events keep coming. once a change made during a recompute
+    # has settled too the recompute is cancelled and the worker starts over
+    # on the newer file. a file that never stops changing still gets redrawn
+    # every max_delay seconds plus the time a recompute takes
+
+    def __init__(
+        self,
+        filename,
+        session=None,
+        options=None,
+        renderer=None,
+        debounce=0.1,
+        max_delay=None,
+    ) -> None:
         self.filename = filename
+        self.path = os.path.abspath(filename)
+        # the directory to watch
+        self.directory = os.path.dirname(self.path)
+        self.session = session
+        self.options = options
+        self.renderer = renderer
+        self.debounce = debounce
+        self.max_delay = 5 * debounce if max_delay is None else max_delay
+        self.condition = threading.Condition()
+        # number of changes seen, to tell when a recompute is outdated
+        self.generation = 0
+        # monotonic times of the first and latest change not yet handled,
+        # and the paths changed
+        self.first_change = None
+        self.latest_change = None
+        self.changed_paths = set()
+        # set to recompute straight away, without waiting for changes
+        self.redraw_requested = False
+        self.stopped = False
+        self.worker = threading.Thread(target=self.recompute_changes, daemon=True)
+
+    def start(self):
+        self.worker.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.generation += 1
+            self.condition.notify()
+        self.worker.join()
+
+    def dispatch(self, event):
+        if event.event_type in ("modified", "created", "moved", "deleted"):
+            self.on_modified(event)
+
+    def is_watched(self, path):
+        return path == self.path
 
     def on_modified(self, event):
-        logging.debug(f"modified: {event.src_path}")
-        logging.debug(f"watching {self.filename}")
-        if self.filename in os.path.basename(event.src_path):
-            run(self.filename)
+        # only the game file itself counts, not the swap and temp files
+        # editors write next to it. saving by renaming a temp file over the
+        # game file is a move with the game file as its destination
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        paths = {os.path.abspath(path) for path in paths if path}
+        paths = {path for path in paths if self.is_watched(path)}
+        if not paths:
+            return
+        logging.debug("modified: %s", ", ".join(sorted(paths)))
+        with self.condition:
+            now = time.monotonic()
+            self.generation += 1
+            if self.first_change is None:
+                self.first_change = now
+            self.latest_change = now
+            self.changed_paths |= paths
+            self.condition.notify()
 
+    def request_redraw(self):
+        with self.condition:
+            self.redraw_requested = True
+            self.condition.notify()
 
-def start_watcher(filename):
-    # Create an observer and event handler
-    observer = Observer()
-    event_handler = FileChangeHandler(filename)
+    def wait_for_changes(self):
+        # (generation, changed paths) to recompute once the changes have
+        # settled, or None once stopped
+        with self.condition:
+            while not self.stopped:
+                if self.redraw_requested:
+                    remaining = 0
+                elif self.first_change is None:
+                    self.condition.wait()
+                    continue
+                else:
+                    due = min(
+                        self.latest_change + self.debounce,
+                        self.first_change + self.max_delay,
+                    )
+                    remaining = due - time.monotonic()
+                if remaining <= 0:
+                    changed_paths = self.changed_paths
+                    self.first_change = None
+                    self.latest_change = None
+                    self.changed_paths = set()
+                    self.redraw_requested = False
+                    return self.generation, changed_paths
+                self.condition.wait(remaining)
+            return None
+
+    def is_stale(self, generation):
+        # read without the lock, a stale read only defers the cancel to the
+        # next check
+        latest_change = self.latest_change
+        return self.stopped or (
+            self.generation != generation
+            and latest_change is not None
+            and time.monotonic() >= latest_change + self.debounce
+        )
+
+    def recompute_changes(self):
+        while (changes := self.wait_for_changes()) is not None:
+            generation, changed_paths = changes
+            try:
+                self.recompute(changed_paths, lambda: self.is_stale(generation))
+            except Cancelled:
+                logging.debug("a newer change cancelled the recompute")
+                with self.condition:
+                    self.changed_paths |= changed_paths
+
+    def recompute(self, changed_paths, cancelled):
+        run(self.filename, self.session, self.options, self.renderer, cancelled)
+
+
+class DirectoryChangeHandler(FileChangeHandler):
+    # follows every game file in a directory with one observer and worker,
+    # see FileChangeHandler. each file keeps its own game so a change only
+    # reprocesses that file. commands typed on stdin switch between the
+    # tables, see TableView, and are handled on the worker too
+
+    def __init__(self, directory, options, renderer, debounce=0.1):
+        super().__init__(directory, None, options, renderer, debounce)
+        self.directory = self.path
+        self.view = TableView(tiled=options.tiled)
+        self.commands = []
+
+    def is_watched(self, path):
+        return os.path.dirname(path) == self.directory and is_game_file(path)
 
-    # Set the path to watch and start the observer
-    path = "."
-    observer.schedule(event_handler, path, recursive=False)
+    def load_tables(self):
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if self.is_watched(path):
+                self.update_table(path)
+        for table in self.view.tables.values():
+            table.unseen = False
+
+    def update_table(self, path):
+        name = os.path.basename(path)
+        if not os.path.isfile(path):
+            self.view.tables.pop(name, None)
+            return
+        table = self.view.tables.get(name)
+        if table is None:
+            session = GameSession(path, checkpoint=self.options.incremental)
+            table = self.view.tables[name] = Table(path, session)
+        table.update(load_game)
+
+    def send_command(self, line):
+        with self.condition:
+            self.commands.append(line)
+        self.request_redraw()
+
+    def recompute(self, changed_paths, cancelled):
+        with self.condition:
+            commands = self.commands
+            self.commands = []
+        for line in commands:
+            if self.view.command(line):
+                self.renderer.reset()
+        for path in sorted(changed_paths):
+            check_cancelled(cancelled)
+            self.update_table(path)
+        check_cancelled(cancelled)
+        self.draw(cancelled)
+
+    def draw(self, cancelled=None):
+        view = self.view
+        table = view.focused()
+        if table is None:
+            self.renderer.draw_text(f"no game files in {self.directory}")
+        elif view.tiled:
+            sheet_view = "probability" if self.options.probabilities else "sheet"
+            width = shutil.get_terminal_size().columns
+            self.renderer.draw_text(view.tiled_str(sheet_view, width))
+        else:
+            table.unseen = False
+            footer = view.tables_str()
+            if table.error is not None:
+                footer = f"\nlatest error: {table.error}\n" + footer
+            if table.game is None:
+                self.renderer.draw_text(f"== {table.name} ==\n" + footer)
+            else:
+                display(table.game, self.options, self.renderer, footer, cancelled)
+
+
+def watch_directory(directory, options, renderer):
+    event_handler = DirectoryChangeHandler(directory, options, renderer, options.debounce)
+    event_handler.load_tables()
+    event_handler.draw()
+
+    def read_commands():
+        for line in sys.stdin:
+            event_handler.send_command(line)
+
+    threading.Thread(target=read_commands, daemon=True).start()
+    observe(event_handler)
+
+
+def start_watcher(filename, session=None, options=None, renderer=None):
+    debounce = 0.1 if options is None else options.debounce
+    observe(FileChangeHandler(filename, session, options, renderer, debounce))
+
+
+def observe(event_handler):
+    # run the handler until interrupted, watching the directory it names
+    from watchdog.observers import Observer
+
+    event_handler.start()
+    observer = Observer()
+    observer.schedule(event_handler, event_handler.directory, recursive=False)
     observer.start()
 
     try:
@@ -285,9 +1065,129 @@ def start_watcher(filename):
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    event_handler.stop()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Clue sheet bot")
+    parser.add_argument(
+        "filename",
+        nargs="?",
+        default="game.yml",
+        help="the game file, or a directory to follow every game file in it",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only process newly appended events on save and checkpoint the "
+        "inferred state in the cache directory",
+    )
+    parser.add_argument(
+        "--probabilities",
+        action="store_true",
+        help="show the chance of each player holding each card, and of each "
+        "card being the solution, over every deal consistent with the events",
+    )
+    parser.add_argument(
+        "--sample",
+        action="store_true",
+        help="estimate the --probabilities view by sampling deals on a process "
+        "pool, for decks too large to count exactly",
+    )
+    parser.add_argument(
+        "--samples", type=int, default=20000, help="sample budget for --sample"
+    )
+    parser.add_argument(
+        "--seconds", type=float, default=None, help="time budget for --sample"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker processes for --sample and --recommend, defaults to the "
+        "number of cpus",
+    )
+    parser.add_argument(
+        "--recommend",
+        type=int,
+        default=0,
+        metavar="N",
+        help="list the N suggestions you could make that are expected to reveal "
+        "the most about the solution and the other hands",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["table", "json"],
+        help="after each update report time, calls and facts derived per "
+        "inference rule, time per phase and facts propagated per event",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help="write the --profile report to FILE instead of stderr",
+    )
+    parser.add_argument(
+        "--stream",
+        metavar="SOURCE",
+        help="after loading the game file, apply events as they arrive one per "
+        "line on stdin (-) or a unix socket at SOURCE instead of watching the file",
+    )
+    parser.add_argument(
+        "--undo",
+        type=int,
+        default=0,
+        metavar="N",
+        help="show the sheet as it was before the last N events",
+    )
+    parser.add_argument(
+        "--what-if",
+        action="append",
+        default=[],
+        metavar="EVENT",
+        help="show the sheet as if EVENT, e.g. '{q: you green rope hall, a: bill "
+        "rope}', had happened after the other events, may be repeated",
+    )
+    parser.add_argument(
+        "--explain",
+        nargs=2,
+        metavar=("PLAYER", "CARD"),
+        help="show below the sheet how it was worked out whether PLAYER has CARD",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.1,
+        metavar="SECONDS",
+        help="wait until the game file has not changed for SECONDS before "
+        "recomputing the sheet, and at most five times as long while it keeps "
+        "changing",
+    )
+    parser.add_argument(
+        "--tiled",
+        action="store_true",
+        help="when following a directory, start with every sheet tiled instead "
+        "of one at a time",
+    )
+    parser.add_argument(
+        "--debug", action="store_true", help="log every inference to stderr"
+    )
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    filename = sys.argv[1] if len(sys.argv) > 1 else "game.yml"
-    run(filename)
-    start_watcher(filename)
+    args = parse_args(sys.argv[1:])
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.WARNING,
+        format="%(levelname)s - %(message)s",
+    )
+    if args.profile:
+        enable_profiling(Profiler())
+    renderer = default_renderer()
+    if os.path.isdir(args.filename):
+        watch_directory(args.filename, args, renderer)
+    elif args.stream:
+        stream_events(args.filename, args.stream, args, renderer)
+    else:
+        session = GameSession(args.filename) if args.incremental else None
+        run(args.filename, session, args, renderer)
+        start_watcher(args.filename, session, args, renderer)
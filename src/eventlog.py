@@ -0,0 +1,41 @@
+from array import array
+
+# compiled event kinds and their tuple lengths, see clue.compile_event
+KINDS = ("q", "r", "accuse")
+LENGTHS = (7, 3, 5)
+# values stored per event: the kind, then the rest of the tuple padded with
+# -1, which also stands for None
+FIELDS = 7
+
+
+class EventLog:
+    # the compiled form of every applied event, packed FIELDS to an event
+    # into one array rather than a tuple each. read back as tuples by explain
+    # and undo
+
+    def __init__(self):
+        self.fields = array("h")
+
+    def __len__(self):
+        return len(self.fields) // FIELDS
+
+    def append(self, compiled):
+        kind = KINDS.index(compiled[0])
+        self.fields.append(kind)
+        self.fields.extend(-1 if value is None else value for value in compiled[1:])
+        self.fields.extend([-1] * (FIELDS - LENGTHS[kind]))
+
+    def __getitem__(self, index):
+        start = index * FIELDS
+        kind = self.fields[start]
+        values = self.fields[start + 1 : start + LENGTHS[kind]]
+        return (KINDS[kind], *(None if value == -1 else value for value in values))
+
+    def events(self, start=0, stop=None):
+        # the compiled events from start up to stop
+        stop = len(self) if stop is None else stop
+        return [self[index] for index in range(start, stop)]
+
+    def truncate(self, count):
+        # forget the events after the first count, see Game.restore
+        del self.fields[count * FIELDS :]
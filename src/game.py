@@ -1,4 +1,25 @@
+from collections import deque
+from eventlog import EventLog
+from probability import deal_probabilities
+from profiling import NO_PROFILER
+from provenance import EXTERNAL, Provenance
+
 COL_1_WIDTH = 15
+# events that can be taken back straight from a snapshot, undoing further is
+# done by replaying the events before them from the first snapshot
+UNDO_WINDOW = 64
+
+
+def iter_bits(mask):
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit
+        mask ^= low_bit
+
+
+class Contradiction(Exception):
+    # the events so far cannot all be true
+    pass
 
 
 class Game:
@@ -23,51 +44,304 @@ class Game:
             "rope",
             "wrench",
         }
-        self._suspect_solution = None
-        self._room_solution = None
-        self._weapon_solution = None
         self.players = []
+        # bit per player.index
+        self.all_players_mask = 0
+        # failed accusations, one per set of three cards, and the event of each
         self.accusations = []
+        self.accusation_events = []
         self.not_solution_cards = []
+        self.not_solution_mask = 0
         self.username = None
+        # newly learned facts waiting to be propagated: (player, mask, has)
+        # where player None means the cards in mask are not the solution
+        self.pending_facts = deque()
+        # the first propagation sweeps every rule once, after that only
+        # the rules touched by new facts are run
+        self.needs_full_review = True
+        # section solutions the inference rules have already reacted to
+        self.solution_found_mask = 0
+        # total facts queued and taken off pending_facts, measures of inference work
+        self.facts_learned = 0
+        self.facts_processed = 0
+        # events applied so far, to say which event caused a contradiction
+        self.events_applied = 0
+        # compiled form of every applied event, see record_event
+        self.event_log = EventLog()
+        # snapshots before the latest UNDO_WINDOW events, and before the first
+        self.recent_snapshots = deque(maxlen=UNDO_WINDOW)
+        self.first_snapshot = None
+        # "sheet" shows known facts, "probability" the odds over all consistent deals
+        self.view = "sheet"
+        # what the inference rules report their time to, see clue.enable_profiling
+        self.profiler = NO_PROFILER
+        self.index_cards()
+
+    def __getstate__(self):
+        # copies and checkpoints are not profiled, see __setstate__
+        state = self.__dict__.copy()
+        del state["profiler"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.profiler = NO_PROFILER
+
+    def index_cards(self):
+        # map every card to a single bit so player knowledge can be kept as
+        # integer masks; must be re-run if the card sets are overwritten
+        self.card_bits = {}
+        self.cards_by_index = []
+        for section_cards in (self.SUSPECTS, self.WEAPONS, self.ROOMS):
+            for card in sorted(section_cards):
+                self.card_bits[card] = 1 << len(self.cards_by_index)
+                self.cards_by_index.append(card)
+        self.suspects_mask = self.mask(self.SUSPECTS)
+        self.weapons_mask = self.mask(self.WEAPONS)
+        self.rooms_mask = self.mask(self.ROOMS)
+        self.all_cards_mask = self.suspects_mask | self.weapons_mask | self.rooms_mask
+        self.index_card_knowledge()
+
+    def index_card_knowledge(self):
+        # per card index, the players (as bits of player.index) known to have
+        # and known not to have the card. kept in step by record_fact so the
+        # section solution and single possible owner lookups are O(1)
+        self.card_owners = [0] * len(self.cards_by_index)
+        self.card_lackers = [0] * len(self.cards_by_index)
+        # cards with a known owner, and cards every player is known not to have
+        self.owned_mask = 0
+        self._nobody_has_mask = self.all_cards_mask
+        self.provenance = Provenance(len(self.cards_by_index), len(self.players))
+        for player in self.players:
+            for bit in iter_bits(player.has_mask):
+                self.card_owners[bit.bit_length() - 1] |= player.bit
+                self.owned_mask |= bit
+            for bit in iter_bits(player.does_not_have_mask):
+                self.card_lackers[bit.bit_length() - 1] |= player.bit
+            self._nobody_has_mask &= player.does_not_have_mask
+
+    def card_bit(self, card):
+        # 0 for cards that are not part of the game
+        return self.card_bits.get(card, 0)
+
+    def mask(self, cards):
+        ret = 0
+        for card in cards:
+            ret |= self.card_bits[card]
+        return ret
+
+    def card_name(self, bit):
+        return self.cards_by_index[bit.bit_length() - 1]
+
+    def cards_in(self, mask):
+        return {self.card_name(bit) for bit in iter_bits(mask)}
+
+    def cards_str(self, mask):
+        return ", ".join(self.card_name(bit) for bit in iter_bits(mask))
+
+    def section_mask(self, bit):
+        for section_mask in (self.suspects_mask, self.weapons_mask, self.rooms_mask):
+            if bit & section_mask:
+                return section_mask
+        return 0
+
+    def queue_fact(self, player, mask, has):
+        self.facts_learned += 1
+        self.pending_facts.append((player, mask, has))
+
+    def reason(self, rule, premises=(), event=None):
+        # why a fact is learned: a provenance rule id, the ids of the facts it
+        # follows from and the event it came from, by default the current one
+        return rule, premises, self.events_applied if event is None else event
+
+    def fact_ids(self, player, mask, has):
+        # ids of known facts, player None for "not the solution" facts
+        row = len(self.players) if player is None else player.index
+        fact_id = self.provenance.fact_id
+        return [fact_id(row, bit.bit_length() - 1, has) for bit in iter_bits(mask)]
+
+    def nobody_has_fact_ids(self, bit):
+        # the facts that make a card the solution
+        ret = []
+        for player in self.players:
+            ret += self.fact_ids(player, bit, False)
+        return ret
+
+    def record_fact(self, player, mask, has, reason=None):
+        # player just learned to have (or not have) the cards in mask. facts
+        # added from outside the rules without a reason are recorded as such
+        conflict = mask & player.has_mask & player.does_not_have_mask
+        if conflict:
+            raise Contradiction(
+                f"{player.name} would both have and not have {self.cards_str(conflict)}"
+            )
+        rule, premises, event = reason or self.reason(EXTERNAL)
+        for bit in iter_bits(mask):
+            card_index = bit.bit_length() - 1
+            self.provenance.record(player.index, card_index, has, rule, premises, event)
+            if has:
+                self.card_owners[card_index] |= player.bit
+                self.owned_mask |= bit
+            else:
+                self.card_lackers[card_index] |= player.bit
+                if self.card_lackers[card_index] == self.all_players_mask:
+                    self.add_nobody_has(bit)
+        self.queue_fact(player, mask, has)
+
+    def add_nobody_has(self, bit):
+        # nobody has the card so it must be the solution of its section
+        other_solutions = self._nobody_has_mask & self.section_mask(bit)
+        if other_solutions:
+            raise Contradiction(
+                f"nobody has {self.card_name(bit)} or {self.card_name(other_solutions)}, "
+                "they cannot both be the solution"
+            )
+        if self.not_solution_mask & bit:
+            raise Contradiction(
+                f"nobody has {self.card_name(bit)} but an accusation rules it out"
+            )
+        self._nobody_has_mask |= bit
+
+    def unknown_players_mask(self, bit):
+        # players, as bits of player.index, that may or may not have the card
+        card_index = bit.bit_length() - 1
+        return self.all_players_mask & ~(
+            self.card_owners[card_index] | self.card_lackers[card_index]
+        )
 
     def all_cards(self):
         return self.SUSPECTS | self.ROOMS | self.WEAPONS
 
     def add_player(self, player):
+        player.index = len(self.players)
+        player.bit = 1 << player.index
         self.players.append(player)
+        self.all_players_mask |= player.bit
+        self.index_card_knowledge()
+
+    def snapshot(self):
+        # the knowledge state between events. masks are ints and the lists
+        # only ever grow between snapshots, so their lengths are enough
+        return (
+            self.events_applied,
+            len(self.accusations),
+            len(self.not_solution_cards),
+            self.not_solution_mask,
+            self.owned_mask,
+            self._nobody_has_mask,
+            self.solution_found_mask,
+            self.needs_full_review,
+            self.facts_learned,
+            self.facts_processed,
+            len(self.provenance),
+            tuple(player.snapshot() for player in self.players),
+        )
+
+    def restore(self, snapshot):
+        # go back to an earlier snapshot, in time proportional to what was
+        # learned since rather than replaying the game
+        (
+            self.events_applied,
+            accusation_count,
+            not_solution_count,
+            self.not_solution_mask,
+            self.owned_mask,
+            self._nobody_has_mask,
+            self.solution_found_mask,
+            self.needs_full_review,
+            self.facts_learned,
+            self.facts_processed,
+            fact_count,
+            player_snapshots,
+        ) = snapshot
+        self.event_log.truncate(self.events_applied)
+        while self.recent_snapshots and self.recent_snapshots[-1][0] >= self.events_applied:
+            self.recent_snapshots.pop()
+        del self.accusations[accusation_count:]
+        del self.accusation_events[accusation_count:]
+        del self.not_solution_cards[not_solution_count:]
+        self.provenance.truncate(fact_count)
+        self.pending_facts.clear()
+        changed_mask = 0
+        for player, player_snapshot in zip(self.players, player_snapshots):
+            changed_mask |= player.restore(player_snapshot)
+        for bit in iter_bits(changed_mask):
+            card_index = bit.bit_length() - 1
+            self.card_owners[card_index] = 0
+            self.card_lackers[card_index] = 0
+            for player in self.players:
+                if player.has_mask & bit:
+                    self.card_owners[card_index] |= player.bit
+                if player.does_not_have_mask & bit:
+                    self.card_lackers[card_index] |= player.bit
 
-    def add_failed_accusation(self, accuse):
+    def record_event(self, compiled):
+        # called by clue.apply_event before compiled is applied
+        snapshot = self.snapshot()
+        if self.events_applied == 0:
+            self.first_snapshot = snapshot
+        self.recent_snapshots.append(snapshot)
+        self.event_log.append(compiled)
+
+    def snapshot_before(self, event_count):
+        # the snapshot from when event_count events had been applied, None if
+        # it has left the undo window. recent_snapshots are one per event up
+        # to the latest
+        if event_count == 0:
+            return self.first_snapshot
+        back = self.events_applied - event_count
+        if back > len(self.recent_snapshots):
+            return None
+        return self.recent_snapshots[-back]
+
+    def add_failed_accusation(self, accuse, event):
+        # the same three cards accused again, by anyone, rule out nothing new
+        for accusation in self.accusations:
+            if (accusation.suspect, accusation.weapon, accusation.room) == (
+                accuse.suspect,
+                accuse.weapon,
+                accuse.room,
+            ):
+                return
         self.accusations.append(accuse)
+        self.accusation_events.append(event)
 
     # append cards that are not the solution but the owner is not known
-    def add_not_solution(self, card):
+    def add_not_solution(self, card, reason=None):
+        bit = self.card_bit(card)
+        if self.not_solution_mask & bit:
+            return
+        if self._nobody_has_mask & bit:
+            raise Contradiction(f"an accusation rules out {card} but nobody has it")
         self.not_solution_cards.append(card)
+        self.not_solution_mask |= bit
+        rule, premises, event = reason or self.reason(EXTERNAL)
+        self.provenance.record(
+            len(self.players), bit.bit_length() - 1, False, rule, premises, event
+        )
+        self.queue_fact(None, bit, False)
+
+    def nobody_has_mask(self):
+        # cards that every player is known not to have
+        return self._nobody_has_mask
 
     def get_section_solution(self, section_cards):
-        for section_card in section_cards:
-            does_not_have_count = 0
-            for player in self.players:
-                if section_card in player.all_known_does_not_have_cards():
-                    does_not_have_count += 1
-            if does_not_have_count == len(self.players):
-                return section_card
-        return None
+        return self._section_solution(self.mask(section_cards))
+
+    def _section_solution(self, section_mask):
+        solution_mask = self._nobody_has_mask & section_mask
+        if solution_mask == 0:
+            return None
+        return self.card_name(solution_mask & -solution_mask)
 
     def suspect_solution(self):
-        if self._suspect_solution is None:
-            self._suspect_solution = self.get_section_solution(self.SUSPECTS)
-        return self._suspect_solution
+        return self._section_solution(self.suspects_mask)
 
     def weapon_solution(self):
-        if self._weapon_solution is None:
-            self._weapon_solution = self.get_section_solution(self.WEAPONS)
-        return self._weapon_solution
+        return self._section_solution(self.weapons_mask)
 
     def room_solution(self):
-        if self._room_solution is None:
-            self._room_solution = self.get_section_solution(self.ROOMS)
-        return self._room_solution
+        return self._section_solution(self.rooms_mask)
 
     def is_solved(self):
         return (
@@ -82,46 +356,96 @@ class Game:
                 return player
         raise Exception("invalid player name: " + name)
 
+    def section_cells(self, section_cards):
+        # the sheet symbol of every (card, player) cell as rows of
+        # (card, [symbol per player]) in display order
+        rows = []
+        no_answer_masks = [player.no_answer_mask for player in self.players]
+        nobody_has_mask = self.nobody_has_mask()
+        for section_card in sorted(list(section_cards)):
+            bit = self.card_bit(section_card)
+            symbols = []
+            for player, no_answer_mask in zip(self.players, no_answer_masks):
+                # player has this card
+                if player.has_mask & bit:
+                    symbols.append("[!]")
+                # player does not have one of these cards
+                elif player.does_not_have_mask & bit:
+                    # nobody has it, so it is the solution
+                    symbols.append("[A]" if nobody_has_mask & bit else "[X]")
+                # player has one of the cards with these symbols
+                elif no_answer_mask & bit:
+                    symbols.append("[⁈]")
+                # player might have this card but this card is not the solution
+                elif self.not_solution_mask & bit:
+                    symbols.append("[-]")
+                else:
+                    symbols.append("[ ]")
+            rows.append((section_card, symbols))
+        return rows
+
     def _section_str(self, section_cards):
         # Print card grid
+        ret = ""
+        for section_card, symbols in self.section_cells(section_cards):
+            row = f"{section_card:_<{COL_1_WIDTH}}"  # Left-align
+            for symbol in symbols:
+                row += f" {symbol} "
+            ret += row + "\n"
+
+        return ret
+
+    def _probability_section_str(self, section_cards, probabilities):
         ret = ""
         for section_card in sorted(list(section_cards)):
-            does_not_have_count = 0
+            bit = self.card_bit(section_card)
             row = f"{section_card:_<{COL_1_WIDTH}}"  # Left-align
             for player in self.players:
-                # player has this card
-                if section_card in player.all_known_cards():
+                if player.has_mask & bit:
                     row += " [!] "
-                # player does not have one of these cards
-                elif section_card in player.all_known_does_not_have_cards():
-                    does_not_have_count += 1
+                elif player.does_not_have_mask & bit:
                     row += " [X] "
-                # player has one of the cards with these symbols
-                elif section_card in player.all_suggestions_with_no_answer_cards():
-                    row += " [⁈] "
-                # player might have this card but this card is not the solution
-                elif section_card in self.not_solution_cards:
-                    row += " [-] "
                 else:
-                    row += " [ ] "
-            if does_not_have_count == len(self.players):
-                row = row.replace(f"[X]", f"[A]")
+                    probability = probabilities.player_probabilities[player.name][section_card]
+                    row += f" {probability:>4.0%}"
+            row += f" {probabilities.solution_probabilities[section_card]:>4.0%}"
             ret += row + "\n"
-
         return ret
 
-    def __str__(self):
+    def probability_str(self, probabilities):
+        # sheet with the odds from deal_probabilities or the sampler in the
+        # unknown cells and an extra envelope column
+        if probabilities is None:
+            return "no deal of the cards is consistent with the events"
+        return self._sheet_str(
+            lambda section_cards: self._probability_section_str(
+                section_cards, probabilities
+            ),
+            " env ",
+        )
+
+    def _sheet_str(self, section_str, extra_header=""):
         player_header = " "
         for player in self.players:
             player_header += f" {player.name[:3]} "
+        player_header += extra_header
 
         ret = ""
         ret += f"{'\nSUSPECTS:': <{COL_1_WIDTH}}{player_header}\n"
-        ret += self._section_str(self.SUSPECTS)
+        ret += section_str(self.SUSPECTS)
         ret += f"{'\nWEAPONS:': <{COL_1_WIDTH}}{player_header}\n"
-        ret += self._section_str(self.WEAPONS)
+        ret += section_str(self.WEAPONS)
         ret += f"{'\nROOMS:': <{COL_1_WIDTH}}{player_header}\n"
-        ret += self._section_str(self.ROOMS)
-        if self.is_solved():
-            ret += f"***SOLVED: {self._suspect_solution} in the {self._room_solution} with the {self._weapon_solution}***"
+        ret += section_str(self.ROOMS)
+        ret += self.solved_str()
         return ret
+
+    def solved_str(self):
+        if self.is_solved():
+            return f"***SOLVED: {self.suspect_solution()} in the {self.room_solution()} with the {self.weapon_solution()}***"
+        return ""
+
+    def __str__(self):
+        if self.view == "probability":
+            return self.probability_str(deal_probabilities(self))
+        return self._sheet_str(self._section_str)
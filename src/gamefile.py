@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+
+COMPILED_VERSION = 2
+
+
+def load_yaml(text):
+    # yaml is only imported once something actually needs parsing, and the
+    # libyaml loader is used when pyyaml was built with it
+    import yaml
+
+    return yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def parse_event(text):
+    # a single event in the same shapes as the events in game.yml, as json or
+    # a yaml flow mapping, e.g. {"q": "bob green rope hall", "a": "joe"}
+    event = load_yaml(text)
+    if not isinstance(event, dict):
+        raise Exception(f"not an event: {text.strip()}")
+    return event
+
+
+def cache_directory():
+    # the directory the compiled caches and checkpoints are kept in, None if
+    # it cannot be made private. checkpoints are pickles, so anyone who could
+    # write to it could run code as the user
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    directory = os.path.join(root, "cluebot")
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        status = os.stat(directory)
+    except OSError:
+        return None
+    if status.st_mode & 0o077 or (
+        hasattr(os, "getuid") and status.st_uid != os.getuid()
+    ):
+        return None
+    return directory
+
+
+def cache_filename(filename, kind):
+    # where the kind ("compiled" or "checkpoint") cache of a game file goes,
+    # keyed by its absolute path so that files of the same name do not clash
+    directory = cache_directory()
+    if directory is None:
+        return None
+    path = os.path.abspath(filename)
+    key = hashlib.sha1(path.encode()).hexdigest()[:16]
+    return os.path.join(directory, f"{os.path.basename(path)}-{key}.{kind}")
+
+
+def open_private(filename, mode):
+    # open a cache file for writing that only the user can read
+    return os.fdopen(
+        os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), mode
+    )
+
+
+class GameFile:
+    # a game file and its compiled cache, which keeps the parsed yaml and the
+    # compiled events (see clue.compile_event) keyed by the hash of the file,
+    # so loading an unchanged file parses and validates nothing. the cache is
+    # json after a header line holding the version and the hash, and is kept
+    # in cache_directory rather than next to the game file
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.cache_filename = cache_filename(filename, "compiled")
+        self.digest = None
+
+    def load(self):
+        # returns the parsed game file and its compiled events, or None for
+        # the events if the cache is missing or stale
+        with open(self.filename, "rb") as file:
+            contents = file.read()
+        self.digest = hashlib.sha1(contents).hexdigest()
+        cached = self.load_cache()
+        if cached is not None:
+            return cached
+        return load_yaml(contents), None
+
+    def header(self):
+        return f"{COMPILED_VERSION} {self.digest}\n".encode()
+
+    def load_cache(self):
+        if self.cache_filename is None:
+            return None
+        try:
+            with open(self.cache_filename, "rb") as file:
+                # nothing is parsed unless the cache is of this very file
+                if file.readline() != self.header():
+                    return None
+                cached = json.loads(file.read())
+            data = cached["data"]
+            compiled_events = [tuple(event) for event in cached["events"]]
+            if len(compiled_events) != len(data["events"] or []):
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return data, compiled_events
+
+    def save_cache(self, data, compiled_events):
+        if self.cache_filename is None:
+            return
+        try:
+            body = json.dumps({"data": data, "events": compiled_events})
+        except (TypeError, ValueError):
+            body = None
+        if body is None or json.loads(body)["data"] != data:
+            # yaml that json cannot hold, e.g. dates, is parsed every time
+            return
+        temp_filename = self.cache_filename + ".tmp"
+        try:
+            with open_private(temp_filename, "wb") as file:
+                file.write(self.header())
+                file.write(body.encode())
+            os.replace(temp_filename, self.cache_filename)
+        except OSError:
+            # the cache is only an optimization, e.g. the disk may be full
+            pass
@@ -1,4 +1,11 @@
-from suggestion import Suggestion
+from clause import Clause
+from game import Contradiction, iter_bits
+from provenance import (
+    ANSWERED_SUGGESTION,
+    CARD_COUNT_REACHED,
+    ONE_OWNER,
+    ONLY_CARDS_LEFT,
+)
 import logging
 
 
@@ -7,129 +14,301 @@ class Player:
         self.game = game
         self.name = name
         self.card_count = None
-        self.weapons = set()
-        self.rooms = set()
-        self.suspects = set()
-        self.does_not_have_suspects = set()
-        self.does_not_have_rooms = set()
-        self.does_not_have_weapons = set()
-        self.answered_suggestions = []
-        self.made_suggestion_with_no_answer = []
-
-    def add_card(self, card):
-        if self.card_count == len(self.all_known_cards()):
-            return  # avoid debug log spam
-        if card in self.game.WEAPONS:
-            self.weapons.add(card)
-        elif card in self.game.ROOMS:
-            self.rooms.add(card)
-        elif card in self.game.SUSPECTS:
-            self.suspects.add(card)
-        else:
+        # position in game.players and its bit, set by game.add_player
+        self.index = None
+        self.bit = 0
+        # bitmasks over game.card_bits
+        self.has_mask = 0
+        self.does_not_have_mask = 0
+        # a clause per answered suggestion that told something new, card mask
+        # -> clause to skip suggestions already answered with the same cards,
+        # and card bit -> clauses watching that card. lists in watches can
+        # hold clauses that no longer watch the card or were taken back by
+        # restore, they are skipped
+        self.clauses = []
+        self.clause_masks = {}
+        self.watches = {}
+        # (clause, watched cards before) for every clause that forced a card
+        # or was satisfied by a card the player turned out to have
+        self.settled = []
+        # the cards of the suggestions this player made that nobody answered
+        self.no_answer_mask = 0
+
+    @property
+    def weapons(self):
+        return self.game.cards_in(self.has_mask & self.game.weapons_mask)
+
+    @property
+    def rooms(self):
+        return self.game.cards_in(self.has_mask & self.game.rooms_mask)
+
+    @property
+    def suspects(self):
+        return self.game.cards_in(self.has_mask & self.game.suspects_mask)
+
+    @property
+    def does_not_have_weapons(self):
+        return self.game.cards_in(self.does_not_have_mask & self.game.weapons_mask)
+
+    @property
+    def does_not_have_rooms(self):
+        return self.game.cards_in(self.does_not_have_mask & self.game.rooms_mask)
+
+    @property
+    def does_not_have_suspects(self):
+        return self.game.cards_in(self.does_not_have_mask & self.game.suspects_mask)
+
+    def known_card_count(self):
+        return self.has_mask.bit_count()
+
+    def add_card(self, card, reason=None):
+        bit = self.game.card_bit(card)
+        if bit == 0:
             raise Exception("invalid card: " + card)
+        if self.card_count == self.known_card_count():
+            if self.has_mask & bit:
+                return  # avoid debug log spam
+            raise Contradiction(
+                f"{self.name} would have {card} on top of all {self.card_count} of "
+                f"their cards: {self.game.cards_str(self.has_mask)}"
+            )
+        game = self.game
+        if not self.has_mask & bit:
+            self.has_mask |= bit
+            game.record_fact(self, bit, True, reason)
 
-        for other_player in self.game.players:
+        one_owner = game.reason(ONE_OWNER, game.fact_ids(self, bit, True))
+        for other_player in game.players:
             if self != other_player:
-                other_player.does_not_have_card(card)
+                other_player.does_not_have_any(bit, one_owner)
 
-        all_known = self.all_known_cards()
-        if len(all_known) >= self.card_count:
-            for other_card in self.game.all_cards():
-                if other_card not in all_known:
+        if self.known_card_count() >= self.card_count:
+            remaining = self.game.all_cards_mask & ~self.has_mask & ~self.does_not_have_mask
+            if remaining:
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
                     logging.debug(
-                        f"hit card count and inferring {self.name} does not have {other_card}"
+                        f"hit card count and inferring {self.name} does not have {self.game.cards_in(remaining)}"
                     )
-                    self.does_not_have_card(other_card)
+                self.does_not_have_any(
+                    remaining,
+                    game.reason(CARD_COUNT_REACHED, game.fact_ids(self, self.has_mask, True)),
+                )
 
     def is_unknown_card(self, card):
-        return (
-            card not in self.all_known_cards()
-            and card not in self.all_known_does_not_have_cards()
+        return not (
+            (self.has_mask | self.does_not_have_mask) & self.game.card_bit(card)
         )
 
     def all_suggestions_with_no_answer_cards(self):
-        ret = set()
-        for suggestion in self.made_suggestion_with_no_answer:
-            ret.add(suggestion.room)
-            ret.add(suggestion.weapon)
-            ret.add(suggestion.suspect)
-        return ret
+        return self.game.cards_in(self.no_answer_mask)
+
+    def add_suggestion_with_no_answer(self, suggestion):
+        self.no_answer_mask |= self.game.mask(
+            (suggestion.suspect, suggestion.weapon, suggestion.room)
+        )
+
+    @property
+    def answered_suggestions(self):
+        # the answered suggestions still telling something about the hand,
+        # i.e. not answered by a card the player is known to have. a tuple,
+        # as it is worked out anew on every call and changing it does nothing
+        return tuple(
+            clause.suggestion
+            for clause in self.clauses
+            if not self.has_mask & clause.mask
+        )
 
     def all_known_cards(self):
-        return self.weapons | self.rooms | self.suspects
+        return self.game.cards_in(self.has_mask)
 
     def all_known_does_not_have_cards(self):
-        return (
-            self.does_not_have_weapons
-            | self.does_not_have_rooms
-            | self.does_not_have_suspects
+        return self.game.cards_in(self.does_not_have_mask)
+
+    def add_answered_suggestion(self, suggestion, event):
+        card_bit = self.game.card_bit
+        bits = (
+            card_bit(suggestion.suspect),
+            card_bit(suggestion.weapon),
+            card_bit(suggestion.room),
         )
+        mask = bits[0] | bits[1] | bits[2]
+        # nothing new if the player is known to have one of the cards, or
+        # answered the same cards before
+        if self.has_mask & mask or mask in self.clause_masks:
+            return
+        clause = Clause(suggestion, bits, event, len(self.clauses))
+        self.clauses.append(clause)
+        self.clause_masks[mask] = clause
+        self.watch_clause(clause)
+
+    def watch_clause(self, clause):
+        # watch two cards that are not ruled out, or add the only card left
+        with self.game.profiler.rule("review_clauses", self.game):
+            open_bits = [
+                bit for bit in clause.bits if not self.does_not_have_mask & bit
+            ]
+            if len(open_bits) >= 2:
+                clause.watched = (open_bits[0], open_bits[1])
+                for bit in clause.watched:
+                    self.watches.setdefault(bit, []).append(clause)
+            else:
+                self.force_clause(clause, open_bits[0] if open_bits else 0)
 
-    def review_suggestions_for_inferrable_cards(self):
+    def force_clause(self, clause, bit):
         # if player responses to guess:         A B C
         # and player does not respond to guess: Z B C
         # we have recorded that player does not
         # have B or C & now can infer that player has 'A'
-        does_not_have_cards = self.all_known_does_not_have_cards()
-        for suggestion in [
-            suggestion
-            for suggestion in self.answered_suggestions
-            if not suggestion.solved
-        ]:
-            if (
-                suggestion.weapon in does_not_have_cards
-                and suggestion.suspect in does_not_have_cards
-            ):
-                logging.debug(
-                    f"inferring from suggestion that {self.name} has card {suggestion.room}"
+        if bit == 0 or self.does_not_have_mask & bit:
+            raise Contradiction(
+                f"{self.name} answered {clause.suggestion} but has none of the cards"
+            )
+        self.settle_clause(clause)
+        game = self.game
+        card = game.card_name(bit)
+        logging.debug("inferring from suggestion that %s has card %s", self.name, card)
+        ruled_out = 0
+        for other_bit in clause.bits:
+            if other_bit != bit:
+                ruled_out |= other_bit
+        self.add_card(
+            card,
+            game.reason(
+                ANSWERED_SUGGESTION,
+                game.fact_ids(self, ruled_out, False),
+                clause.event,
+            ),
+        )
+
+    def settle_clause(self, clause):
+        # the clause needs no more watching, see restore
+        self.settled.append((clause, clause.watched))
+        clause.watched = ()
+
+    def review_clause(self, clause, ruled_out_bit):
+        # ruled_out_bit was watched and is now ruled out: watch another card
+        # that is not ruled out, otherwise the other watched card is the answer
+        with self.game.profiler.rule("review_clauses", self.game):
+            first, second = clause.watched
+            other_bit = second if first == ruled_out_bit else first
+            for bit in clause.bits:
+                if bit != other_bit and not self.does_not_have_mask & bit:
+                    clause.watched = (other_bit, bit)
+                    self.watches.setdefault(bit, []).append(clause)
+                    return
+            self.force_clause(clause, other_bit)
+
+    def review_clauses_watching(self, mask):
+        # only the clauses watching a newly ruled out card can change
+        for bit in iter_bits(mask):
+            watching = self.watches.pop(bit, ())
+            for position, clause in enumerate(watching):
+                if bit in clause.watched and self.is_live(clause):
+                    if self.has_mask & clause.mask:
+                        # satisfied, drop it instead of watching another card
+                        self.settle_clause(clause)
+                        continue
+                    try:
+                        self.review_clause(clause, bit)
+                    except Contradiction:
+                        # keep the clauses not reviewed yet watched, for restore
+                        self.watches.setdefault(bit, []).extend(watching[position:])
+                        raise
+
+    def is_live(self, clause):
+        return clause.index < len(self.clauses) and self.clauses[clause.index] is clause
+
+    def review_all_clauses(self):
+        # clauses watching cards that were ruled out without being propagated
+        for clause in self.clauses:
+            if clause.watched and self.has_mask & clause.mask:
+                self.settle_clause(clause)
+                continue
+            for bit in [bit for bit in clause.watched if self.does_not_have_mask & bit]:
+                if bit in clause.watched:
+                    self.review_clause(clause, bit)
+
+    def snapshot(self):
+        return (
+            self.has_mask,
+            self.does_not_have_mask,
+            len(self.clauses),
+            len(self.settled),
+            self.no_answer_mask,
+        )
+
+    def restore(self, snapshot):
+        # see Game.restore, returns the cards whose knowledge changed. watches
+        # are left alone: cards only get ruled out over time, so every card
+        # watched now was not ruled out at the snapshot either
+        (
+            has_mask,
+            does_not_have_mask,
+            clause_count,
+            settled_count,
+            self.no_answer_mask,
+        ) = snapshot
+        changed_mask = (self.has_mask ^ has_mask) | (
+            self.does_not_have_mask ^ does_not_have_mask
+        )
+        self.has_mask = has_mask
+        self.does_not_have_mask = does_not_have_mask
+        for clause in self.clauses[clause_count:]:
+            del self.clause_masks[clause.mask]
+        del self.clauses[clause_count:]
+        # clauses settled since the snapshot watch their cards from before again
+        while len(self.settled) > settled_count:
+            clause, watched = self.settled.pop()
+            if not self.is_live(clause):
+                continue
+            clause.watched = watched
+            for bit in watched:
+                watching = self.watches.setdefault(bit, [])
+                if clause not in watching:
+                    watching.append(clause)
+        return changed_mask
+
+    def check_number_of_remaining_against_number_of_unknown(self):
+        # e.g. if player has 1 card left, and there is only one card the player could have, add that card
+        game = self.game
+        with game.profiler.rule(
+            "check_number_of_remaining_against_number_of_unknown", game
+        ):
+            remaining_unknown = (
+                game.all_cards_mask & ~self.has_mask & ~self.does_not_have_mask
+            )
+            missing_count = self.card_count - self.known_card_count()
+            if remaining_unknown.bit_count() < missing_count:
+                raise Contradiction(
+                    f"{self.name} has {missing_count} unknown cards but could only have "
+                    f"{game.cards_str(remaining_unknown) or 'no more cards'}"
                 )
-                self.add_card(suggestion.room)
-                suggestion.solved = True
-            elif (
-                suggestion.room in does_not_have_cards
-                and suggestion.suspect in does_not_have_cards
-            ):
+            if remaining_unknown and remaining_unknown.bit_count() == missing_count:
+                remaining_cards = game.cards_in(remaining_unknown)
                 logging.debug(
-                    f"inferring from suggestion that {self.name} has card {suggestion.weapon}"
+                    "%s could only have cards: %s", self.name, remaining_cards
                 )
-                self.add_card(suggestion.weapon)
-                suggestion.solved = True
-            elif (
-                suggestion.weapon in does_not_have_cards
-                and suggestion.room in does_not_have_cards
-            ):
-                logging.debug(
-                    f"inferring from suggestion that {self.name} has card {suggestion.suspect}"
+                reason = game.reason(
+                    ONLY_CARDS_LEFT,
+                    game.fact_ids(self, self.has_mask, True)
+                    + game.fact_ids(self, self.does_not_have_mask, False),
                 )
-                self.add_card(suggestion.suspect)
-                suggestion.solved = True
+                for card in remaining_cards:
+                    self.add_card(card, reason)
 
-    def check_number_of_remaining_against_number_of_unknown(self):
-        # e.g. if player has 1 card left, and there is only one card the player could have, add that card
-        remaining_unknown = (
-            self.game.all_cards()
-            - self.all_known_cards()
-            - self.all_known_does_not_have_cards()
-        )
-        if len(remaining_unknown) > 0 and len(remaining_unknown) == (
-            self.card_count - len(self.all_known_cards())
-        ):
-            logging.debug(f"{self.name} could only have cards: {remaining_unknown}")
-            for card in remaining_unknown:
-                self.add_card(card)
-
-    def does_not_have_card(self, card):
-        if card in self.game.WEAPONS:
-            self.does_not_have_weapons.add(card)
-        elif card in self.game.ROOMS:
-            self.does_not_have_rooms.add(card)
-        elif card in self.game.SUSPECTS:
-            self.does_not_have_suspects.add(card)
-
-    def does_not_have_suggestion(self, suggestion):
-        self.does_not_have_card(suggestion.suspect)
-        self.does_not_have_card(suggestion.weapon)
-        self.does_not_have_card(suggestion.room)
+    def does_not_have_card(self, card, reason=None):
+        self.does_not_have_any(self.game.card_bit(card), reason)
+
+    def does_not_have_any(self, mask, reason=None):
+        new_mask = mask & ~self.does_not_have_mask
+        if new_mask:
+            self.does_not_have_mask |= new_mask
+            self.game.record_fact(self, new_mask, False, reason)
+
+    def does_not_have_suggestion(self, suggestion, reason=None):
+        self.does_not_have_card(suggestion.suspect, reason)
+        self.does_not_have_card(suggestion.weapon, reason)
+        self.does_not_have_card(suggestion.room, reason)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
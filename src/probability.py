@@ -0,0 +1,282 @@
+# a clause is satisfied when at least one of its (card, hand) literals holds
+SOME = 0
+# a clause is satisfied when at least one of its (card, hand) literals fails
+NOT_ALL = 1
+
+
+class DealProbabilities:
+    def __init__(self, deal_count, player_probabilities, solution_probabilities):
+        # number of card deals consistent with everything known
+        self.deal_count = deal_count
+        # player name -> card -> probability the player holds the card
+        self.player_probabilities = player_probabilities
+        # card -> probability the card is in the envelope
+        self.solution_probabilities = solution_probabilities
+
+
+class DealConstraints:
+    # the game knowledge flattened into hands, allowed hands per card and
+    # clauses. hands are the players followed by one envelope hand per
+    # section, each of which holds exactly one card
+
+    def __init__(self, game):
+        self.game = game
+        self.cards = list(game.cards_by_index)
+        player_count = len(game.players)
+        section_masks = [game.suspects_mask, game.weapons_mask, game.rooms_mask]
+        self.hand_count = player_count + len(section_masks)
+        self.needs = [player.card_count for player in game.players] + [1, 1, 1]
+
+        self.allowed = []
+        for index, card in enumerate(self.cards):
+            bit = 1 << index
+            owners = [i for i, p in enumerate(game.players) if p.has_mask & bit]
+            if owners:
+                hands = owners
+            else:
+                hands = [
+                    i
+                    for i, p in enumerate(game.players)
+                    if not p.does_not_have_mask & bit
+                ]
+                if not game.not_solution_mask & bit:
+                    for section_index, section_mask in enumerate(section_masks):
+                        if bit & section_mask:
+                            hands.append(player_count + section_index)
+            self.allowed.append(hands)
+
+        clauses = set()
+        for player_index, player in enumerate(game.players):
+            for suggestion in player.answered_suggestions:
+                clauses.add(
+                    (
+                        SOME,
+                        frozenset(
+                            (self.card_index(card), player_index)
+                            for card in (suggestion.suspect, suggestion.weapon, suggestion.room)
+                        ),
+                    )
+                )
+        for accusation in game.accusations:
+            clauses.add(
+                (
+                    NOT_ALL,
+                    frozenset(
+                        (self.card_index(card), player_count + section_index)
+                        for section_index, card in enumerate(
+                            (accusation.suspect, accusation.weapon, accusation.room)
+                        )
+                    ),
+                )
+            )
+        self.clauses = []
+        self.contradiction = False
+        for kind, literals in clauses:
+            literals = self._simplify(kind, literals)
+            if literals is None:
+                continue
+            if not literals:
+                self.contradiction = True
+            self.clauses.append((kind, literals))
+
+    def card_index(self, card):
+        return self.game.card_bit(card).bit_length() - 1
+
+    def _simplify(self, kind, literals):
+        # drop literals whose value is already fixed, returns None if the
+        # clause is already satisfied
+        open_literals = []
+        for card_index, hand in literals:
+            allowed = self.allowed[card_index]
+            possible = hand in allowed
+            certain = allowed == [hand]
+            if kind == SOME:
+                if certain:
+                    return None
+                if possible:
+                    open_literals.append((card_index, hand))
+            else:
+                if not possible:
+                    return None
+                if not certain:
+                    open_literals.append((card_index, hand))
+        return open_literals
+
+    def card_order(self):
+        # order the cards so that as few clauses as possible are open at
+        # once, every open clause doubles the possible dp states
+        clause_cards = [{card for card, _ in literals} for _, literals in self.clauses]
+        remaining = set(range(len(self.cards)))
+        seen = set()
+        order = []
+        while remaining:
+
+            def cost(card):
+                opened = closed = 0
+                for cards in clause_cards:
+                    if card not in cards:
+                        continue
+                    if not cards & seen:
+                        opened += 1
+                    if cards - seen == {card}:
+                        closed += 1
+                return (opened - closed, len(self.allowed[card]) > 1, card)
+
+            card = min(remaining, key=cost)
+            remaining.remove(card)
+            seen.add(card)
+            order.append(card)
+        return order
+
+
+class DealCounter:
+    # counts every consistent deal with a dp over cards. the dp state is the
+    # number of cards each hand still needs plus a bit per open clause that
+    # is not yet decided
+
+    def __init__(self, game):
+        self.game = game
+        constraints = DealConstraints(game)
+        self.constraints = constraints
+        self.deal_count = 0
+        # (position, state) -> moves used by sample
+        self._choice_cache = {}
+        if constraints.contradiction or any(need is None for need in constraints.needs):
+            return
+        if sum(constraints.needs) != len(constraints.cards):
+            return
+
+        self.order = constraints.card_order()
+        position = {card: i for i, card in enumerate(self.order)}
+        card_count = len(self.order)
+        hand_count = constraints.hand_count
+
+        # per position, the clauses first and last touched there and the
+        # clause literals on the card at that position
+        self.opens = [0] * card_count
+        self.closes = [0] * card_count
+        self.literals_at = [[] for _ in range(card_count)]
+        for clause_index, (kind, literals) in enumerate(constraints.clauses):
+            positions = [position[card] for card, _ in literals]
+            self.opens[min(positions)] |= 1 << clause_index
+            self.closes[max(positions)] |= 1 << clause_index
+            for card, hand in literals:
+                self.literals_at[position[card]].append((clause_index, kind, hand))
+
+        # available[i][h] is how many of the cards from position i on can go to h
+        self.available = [[0] * hand_count for _ in range(card_count + 1)]
+        for i in range(card_count - 1, -1, -1):
+            self.available[i] = list(self.available[i + 1])
+            for hand in constraints.allowed[self.order[i]]:
+                self.available[i][hand] += 1
+
+        # forward pass: ways to reach each state before position i
+        self.layers = [{(tuple(constraints.needs), 0): 1}]
+        for i in range(card_count):
+            layer = {}
+            for state, ways in self.layers[i].items():
+                for hand in constraints.allowed[self.order[i]]:
+                    next_state = self.step(i, state, hand)
+                    if next_state is not None:
+                        layer[next_state] = layer.get(next_state, 0) + ways
+            self.layers.append(layer)
+
+        self.deal_count = sum(self.layers[card_count].values())
+        if self.deal_count == 0:
+            return
+
+        # backward pass: completions[i] is the number of ways to finish the
+        # deal from each state before position i, and hand_deals counts how
+        # many deals put the card at each position in each hand
+        self.completions = [None] * card_count + [
+            {state: 1 for state in self.layers[card_count]}
+        ]
+        self.hand_deals = [[0] * hand_count for _ in range(card_count)]
+        for i in range(card_count - 1, -1, -1):
+            completions = {}
+            for state, ways in self.layers[i].items():
+                total = 0
+                for hand in constraints.allowed[self.order[i]]:
+                    next_state = self.step(i, state, hand)
+                    if next_state is None:
+                        continue
+                    count = self.completions[i + 1].get(next_state, 0)
+                    if count:
+                        total += count
+                        self.hand_deals[i][hand] += ways * count
+                if total:
+                    completions[state] = total
+            self.completions[i] = completions
+
+    def step(self, i, state, hand):
+        needs, pending = state
+        if needs[hand] == 0:
+            return None
+        needs = needs[:hand] + (needs[hand] - 1,) + needs[hand + 1 :]
+        pending |= self.opens[i]
+        for clause_index, kind, literal_hand in self.literals_at[i]:
+            if (literal_hand == hand) == (kind == SOME):
+                pending &= ~(1 << clause_index)
+        if pending & self.closes[i]:
+            return None
+        following = self.available[i + 1]
+        for h in range(len(needs)):
+            if needs[h] > following[h]:
+                return None
+        return (needs, pending)
+
+    def probabilities(self):
+        if self.deal_count == 0:
+            return None
+        game = self.game
+        player_count = len(game.players)
+        player_probabilities = {player.name: {} for player in game.players}
+        solution_probabilities = {}
+        for i, card_index in enumerate(self.order):
+            card = self.constraints.cards[card_index]
+            for player_index, player in enumerate(game.players):
+                player_probabilities[player.name][card] = (
+                    self.hand_deals[i][player_index] / self.deal_count
+                )
+            solution_probabilities[card] = (
+                sum(self.hand_deals[i][player_count:]) / self.deal_count
+            )
+        return DealProbabilities(
+            self.deal_count, player_probabilities, solution_probabilities
+        )
+
+    def sample(self, rng):
+        # one deal drawn uniformly from all consistent deals, as the hand
+        # index of every card. hands past the players are the envelope
+        hand_of = [None] * len(self.order)
+        state = (tuple(self.constraints.needs), 0)
+        for i, card_index in enumerate(self.order):
+            choices, weights = self._choices(i, state)
+            hand, state = rng.choices(choices, cum_weights=weights)[0]
+            hand_of[card_index] = hand
+        return hand_of
+
+    def _choices(self, i, state):
+        # possible (hand, next state) moves with cumulative completion counts,
+        # memoised since repeated samples walk the same states
+        key = (i, state)
+        if key not in self._choice_cache:
+            choices = []
+            weights = []
+            total = 0
+            for hand in self.constraints.allowed[self.order[i]]:
+                next_state = self.step(i, state, hand)
+                if next_state is None:
+                    continue
+                count = self.completions[i + 1].get(next_state, 0)
+                if count:
+                    total += count
+                    choices.append((hand, next_state))
+                    weights.append(total)
+            self._choice_cache[key] = (choices, weights)
+        return self._choice_cache[key]
+
+
+def deal_probabilities(game):
+    # exact marginals over every consistent deal
+    return DealCounter(game).probabilities()
@@ -0,0 +1,105 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    # wall time, call counts and facts derived per inference rule, time per
+    # phase (yaml load, parsing, rendering) and facts propagated per event.
+    # the rules report to the profiler of their game, which is NO_PROFILER
+    # unless one was given, so a run without one pays next to nothing
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # name -> [calls, seconds, facts derived]
+        self.rules = {}
+        # name -> [calls, seconds]
+        self.phases = {}
+        # facts taken off the queue by each propagation, one per event
+        self.facts_per_event = []
+
+    @contextmanager
+    def rule(self, name, game):
+        # only the rules that do not call other rules report, so no time is
+        # counted twice
+        facts_before = game.facts_learned
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.rules.setdefault(name, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+            stats[2] += game.facts_learned - facts_before
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+
+    def record_propagation(self, fact_count):
+        self.facts_per_event.append(fact_count)
+
+    def report(self):
+        facts = self.facts_per_event
+        return {
+            "rules": {
+                name: {"calls": calls, "seconds": seconds, "facts": derived}
+                for name, (calls, seconds, derived) in self.rules.items()
+            },
+            "phases": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in self.phases.items()
+            },
+            "propagation": {
+                "events": len(facts),
+                "facts": sum(facts),
+                "mean_facts_per_event": sum(facts) / len(facts) if facts else 0,
+                "max_facts_per_event": max(facts, default=0),
+            },
+        }
+
+    def report_json(self):
+        return json.dumps(self.report(), indent=2)
+
+    def report_table(self):
+        report = self.report()
+        ret = f"{'RULE':<56}{'CALLS':>8}{'MS':>10}{'FACTS':>8}\n"
+        for name, stats in sorted(
+            report["rules"].items(), key=lambda item: -item[1]["seconds"]
+        ):
+            ret += f"{name:<56}{stats['calls']:>8}{stats['seconds'] * 1000:>10.3f}{stats['facts']:>8}\n"
+        ret += f"\n{'PHASE':<56}{'CALLS':>8}{'MS':>10}\n"
+        for name, stats in report["phases"].items():
+            ret += f"{name:<56}{stats['calls']:>8}{stats['seconds'] * 1000:>10.3f}\n"
+        propagation = report["propagation"]
+        ret += (
+            f"\n{propagation['events']} events propagated {propagation['facts']} facts, "
+            f"mean {propagation['mean_facts_per_event']:.1f} max "
+            f"{propagation['max_facts_per_event']} per event\n"
+        )
+        return ret
+
+
+class NoProfiler:
+    # measures nothing, the profiler of every game unless one was given
+
+    def rule(self, name, game):
+        return NOTHING
+
+    def phase(self, name):
+        return NOTHING
+
+    def record_propagation(self, fact_count):
+        pass
+
+
+NOTHING = nullcontext()
+NO_PROFILER = NoProfiler()
@@ -0,0 +1,85 @@
+from array import array
+
+# rule ids, see RULE_DESCRIPTIONS
+DEALT = 0
+SHOWN = 1
+REVEALED = 2
+COULD_NOT_ANSWER = 3
+ANSWERED_SUGGESTION = 4
+ONE_OWNER = 5
+CARD_COUNT_REACHED = 6
+ONLY_CARDS_LEFT = 7
+ONLY_POSSIBLE_OWNER = 8
+LAST_CARD_IN_SECTION = 9
+FAILED_ACCUSATION = 10
+EXTERNAL = 11
+
+RULE_DESCRIPTIONS = [
+    "dealt to the user",
+    "shown to the user",
+    "revealed",
+    "could not answer the suggestion",
+    "answered a suggestion whose other cards they do not have",
+    "a card has only one owner",
+    "all of their cards are known",
+    "the only cards left they could have",
+    "the only player who could have a card that is not the solution",
+    "every other card in the section is held or ruled out, so it is the solution",
+    "the accusation was wrong and its other two cards are the solution",
+    "added without a recorded reason",
+]
+
+
+class Provenance:
+    # why every fact was learned: one record per fact in parallel arrays
+    # indexed by fact id, holding the rule, the event being applied (0 for
+    # the setup) and the ids of the facts it was derived from. the records
+    # are only turned into text by explain
+
+    def __init__(self, card_count, player_count):
+        self.card_count = card_count
+        # player index, or player_count for "not the solution" facts
+        self.players = array("h")
+        self.cards = array("h")
+        self.has = array("b")
+        self.rules = array("b")
+        self.events = array("i")
+        # premises of fact i are premises[premise_starts[i]:premise_starts[i + 1]]
+        self.premise_starts = array("i", [0])
+        self.premises = array("i")
+        # ((player row * 2) + has) * card_count + card -> fact id, -1 if unknown
+        self.fact_ids = array("i", [-1]) * ((player_count + 1) * 2 * card_count)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def slot(self, player_row, card_index, has):
+        return (player_row * 2 + has) * self.card_count + card_index
+
+    def fact_id(self, player_row, card_index, has):
+        return self.fact_ids[self.slot(player_row, card_index, has)]
+
+    def record(self, player_row, card_index, has, rule, premises, event):
+        fact_id = len(self.rules)
+        self.fact_ids[self.slot(player_row, card_index, has)] = fact_id
+        self.players.append(player_row)
+        self.cards.append(card_index)
+        self.has.append(has)
+        self.rules.append(rule)
+        self.events.append(event)
+        self.premises.extend(premises)
+        self.premise_starts.append(len(self.premises))
+        return fact_id
+
+    def premises_of(self, fact_id):
+        return self.premises[self.premise_starts[fact_id] : self.premise_starts[fact_id + 1]]
+
+    def truncate(self, count):
+        # forget the facts learned after the first count, see Game.restore
+        for fact_id in range(count, len(self.rules)):
+            slot = self.slot(self.players[fact_id], self.cards[fact_id], self.has[fact_id])
+            self.fact_ids[slot] = -1
+        for column in (self.players, self.cards, self.has, self.rules, self.events):
+            del column[count:]
+        del self.premises[self.premise_starts[count] :]
+        del self.premise_starts[count + 1 :]
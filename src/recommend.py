@@ -0,0 +1,169 @@
+import itertools
+import math
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from probability import DealCounter
+
+# ranked recommendations per knowledge state, see knowledge_key
+_cache = {}
+CACHE_SIZE = 32
+
+
+class Recommendation:
+    def __init__(self, suspect, weapon, room, information_gain, answer_odds):
+        self.suspect = suspect
+        self.weapon = weapon
+        self.room = room
+        # expected bits of information about the deal from the answer
+        self.information_gain = information_gain
+        # answerer name (or "nobody") -> probability they answer
+        self.answer_odds = answer_odds
+
+    def __str__(self):
+        odds = ", ".join(
+            f"{name} {probability:.0%}"
+            for name, probability in sorted(
+                self.answer_odds.items(), key=lambda item: -item[1]
+            )
+        )
+        return f"{self.suspect} {self.weapon} {self.room}: {self.information_gain:.2f} bits ({odds})"
+
+
+def knowledge_key(game):
+    # everything the deal probabilities depend on, to reuse rankings when the
+    # knowledge state is unchanged
+    return (
+        game.username,
+        tuple(game.cards_by_index),
+        tuple(
+            (
+                player.name,
+                player.card_count,
+                player.has_mask,
+                player.does_not_have_mask,
+                frozenset(
+                    (suggestion.suspect, suggestion.weapon, suggestion.room)
+                    for suggestion in player.answered_suggestions
+                ),
+            )
+            for player in game.players
+        ),
+        game.not_solution_mask,
+        frozenset(
+            (accusation.suspect, accusation.weapon, accusation.room)
+            for accusation in game.accusations
+        ),
+    )
+
+
+def answer_order(game, asker_index):
+    # players asked in turn after the asker, same as players_between in
+    # process_suggestion
+    player_count = len(game.players)
+    return [(asker_index + offset) % player_count for offset in range(1, player_count)]
+
+
+def score_candidates(candidates, order, deals):
+    # expected information gain of each (suspect, weapon, room) card index
+    # triple. the answer is a function of the deal plus the answerer's choice
+    # among their matching cards, so I(answer; deal) = H(answer) - H(answer | deal)
+    scores = []
+    for candidate in candidates:
+        outcome_weights = {}
+        choice_entropy = 0.0
+        for hand_of in deals:
+            for player_index in order:
+                matching = [card for card in candidate if hand_of[card] == player_index]
+                if matching:
+                    share = 1 / len(matching)
+                    for card in matching:
+                        outcome = (player_index, card)
+                        outcome_weights[outcome] = outcome_weights.get(outcome, 0) + share
+                    choice_entropy += math.log2(len(matching))
+                    break
+            else:
+                outcome_weights[None] = outcome_weights.get(None, 0) + 1
+        deal_count = len(deals)
+        answer_entropy = -sum(
+            weight / deal_count * math.log2(weight / deal_count)
+            for weight in outcome_weights.values()
+        )
+        answerer_odds = {}
+        for outcome, weight in outcome_weights.items():
+            answerer = None if outcome is None else outcome[0]
+            answerer_odds[answerer] = answerer_odds.get(answerer, 0) + weight / deal_count
+        scores.append((answer_entropy - choice_entropy / deal_count, answerer_odds))
+    return scores
+
+
+def recommend_suggestions(game, top=5, samples=2000, workers=None, seed=0):
+    # rank every suggestion the user could make by the expected information
+    # it reveals about the envelope and the other hands, estimated over deals
+    # sampled uniformly from all consistent deals
+    key = (knowledge_key(game), top, samples, seed)
+    if key in _cache:
+        return _cache[key]
+
+    counter = DealCounter(game)
+    if counter.deal_count == 0 or game.username is None:
+        return []
+    rng = random.Random(seed)
+    deals = [counter.sample(rng) for _ in range(samples)]
+
+    card_index = {card: i for i, card in enumerate(game.cards_by_index)}
+    candidates = list(
+        itertools.product(sorted(game.SUSPECTS), sorted(game.WEAPONS), sorted(game.ROOMS))
+    )
+    candidate_indexes = [
+        tuple(card_index[card] for card in candidate) for candidate in candidates
+    ]
+    order = answer_order(game, game.players.index(game.get_player(game.username)))
+
+    # each candidate is scored independently, split them across the pool
+    workers = workers or os.cpu_count() or 1
+    chunk_size = math.ceil(len(candidate_indexes) / workers)
+    chunks = [
+        candidate_indexes[i : i + chunk_size]
+        for i in range(0, len(candidate_indexes), chunk_size)
+    ]
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        scores = [
+            score
+            for chunk_scores in executor.map(
+                score_candidates, chunks, itertools.repeat(order), itertools.repeat(deals)
+            )
+            for score in chunk_scores
+        ]
+
+    recommendations = []
+    for (suspect, weapon, room), (information_gain, answerer_odds) in zip(
+        candidates, scores
+    ):
+        answer_odds = {
+            "nobody" if answerer is None else game.players[answerer].name: probability
+            for answerer, probability in answerer_odds.items()
+        }
+        recommendations.append(
+            Recommendation(suspect, weapon, room, information_gain, answer_odds)
+        )
+    recommendations.sort(key=lambda recommendation: -recommendation.information_gain)
+    recommendations = recommendations[:top]
+
+    if len(_cache) >= CACHE_SIZE:
+        _cache.clear()
+    _cache[key] = recommendations
+    return recommendations
+
+
+def recommendations_str(recommendations):
+    if not recommendations:
+        return ""
+    ret = "\nBEST SUGGESTIONS:\n"
+    for rank, recommendation in enumerate(recommendations, 1):
+        ret += f"{rank}. {recommendation}\n"
+    return ret
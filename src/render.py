@@ -0,0 +1,145 @@
+import sys
+
+from game import COL_1_WIDTH
+
+CLEAR_SCREEN = "\x1b[2J\x1b[H"
+CLEAR_LINE = "\x1b[2K"
+HIGHLIGHT = "\x1b[1;7m"
+RESET = "\x1b[0m"
+SECTION_TITLES = ("SUSPECTS:", "WEAPONS:", "ROOMS:")
+
+
+def default_renderer():
+    # cursor addressing only makes sense on a terminal
+    if sys.stdout.isatty():
+        return TerminalRenderer()
+    return PlainRenderer()
+
+
+def move_to(line, column):
+    # ansi cursor addressing is 1 based
+    return f"\x1b[{line + 1};{column + 1}H"
+
+
+class TerminalRenderer:
+    # draws the sheet in place: after the first frame only the cells and
+    # lines that changed are rewritten, and cells changed by the latest
+    # update are highlighted until the next one
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        # line index -> text of the last frame, None before the first frame
+        self.lines = None
+        # layout of the last sheet, None if the last frame was plain text
+        self.layout = None
+        # (line index, player index) -> symbol of the last sheet
+        self.cells = {}
+        self.highlighted = set()
+
+    def reset(self):
+        # draw the next frame in full, e.g. when it shows another game
+        self.lines = None
+        self.layout = None
+
+    def sheet_frame(self, game, footer):
+        # lines of the sheet without the cell symbols, and the symbols
+        player_header = " "
+        for player in game.players:
+            player_header += f" {player.name[:3]} "
+
+        lines = []
+        cells = {}
+        sections = (game.SUSPECTS, game.WEAPONS, game.ROOMS)
+        for title, section_cards in zip(SECTION_TITLES, sections):
+            lines.append("")
+            lines.append(f"{title: <{COL_1_WIDTH - 1}}{player_header}")
+            for section_card, symbols in game.section_cells(section_cards):
+                line_index = len(lines)
+                lines.append(f"{section_card:_<{COL_1_WIDTH}}")
+                for player_index, symbol in enumerate(symbols):
+                    cells[(line_index, player_index)] = symbol
+        lines.extend(game.solved_str().split("\n"))
+        if footer:
+            lines.extend(footer.rstrip("\n").split("\n"))
+        return lines, cells
+
+    def draw_game(self, game, footer=""):
+        lines, cells = self.sheet_frame(game, footer)
+        layout = (
+            tuple(player.name for player in game.players),
+            tuple(line for line_index, line in enumerate(lines) if (line_index, 0) in cells),
+        )
+        if layout != self.layout:
+            self._draw_all(lines, cells)
+            self.layout = layout
+            return
+
+        ret = ""
+        changed = {key for key, symbol in cells.items() if self.cells.get(key) != symbol}
+        for key in sorted(changed | self.highlighted):
+            line_index, player_index = key
+            symbol = cells[key]
+            column = COL_1_WIDTH + 5 * player_index + 1
+            ret += move_to(line_index, column)
+            ret += HIGHLIGHT + symbol + RESET if key in changed else symbol
+        ret += self._changed_lines(lines, skip=cells)
+        self.cells = cells
+        self.highlighted = changed
+        self._flush(ret, len(lines))
+
+    def draw_text(self, text):
+        # plain text such as errors or the probability views, diffed by line
+        lines = text.rstrip("\n").split("\n")
+        if self.layout is not None or self.lines is None:
+            self._draw_all(lines, {})
+            self.layout = None
+            return
+        self._flush(self._changed_lines(lines), len(lines))
+
+    def _draw_all(self, lines, cells):
+        symbols = {}
+        for (line_index, _), symbol in cells.items():
+            symbols.setdefault(line_index, []).append(f" {symbol} ")
+        text = ""
+        for line_index, line in enumerate(lines):
+            text += line + "".join(symbols.get(line_index, ())) + "\n"
+        self.lines = lines
+        self.cells = cells
+        self.highlighted = set()
+        self._flush(CLEAR_SCREEN + text, len(lines))
+
+    def _changed_lines(self, lines, skip=()):
+        # rewrite whole lines that differ from the last frame, grid lines are
+        # handled cell by cell so their labels never change here
+        ret = ""
+        grid_lines = {line_index for line_index, _ in skip}
+        for line_index in range(max(len(lines), len(self.lines))):
+            if line_index in grid_lines:
+                continue
+            line = lines[line_index] if line_index < len(lines) else ""
+            previous = self.lines[line_index] if line_index < len(self.lines) else ""
+            if line != previous:
+                ret += move_to(line_index, 0) + CLEAR_LINE + line
+        self.lines = lines
+        return ret
+
+    def _flush(self, text, line_count):
+        # park the cursor under the frame
+        self.out.write(text + move_to(line_count, 0))
+        self.out.flush()
+
+
+class PlainRenderer:
+    # prints every frame in full, for output that is not a terminal
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+
+    def reset(self):
+        pass
+
+    def draw_game(self, game, footer=""):
+        print(str(game) + footer, file=self.out)
+
+    def draw_text(self, text):
+        print(text, file=self.out)
@@ -0,0 +1,401 @@
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from probability import NOT_ALL, SOME, DealConstraints
+
+# z value for the 95% confidence intervals
+Z_95 = 1.96
+# time a chain may search for its starting deal when no budget is given
+SEARCH_SECONDS = 30.0
+# nodes the first search for a starting deal may visit, doubled on every restart
+SEARCH_NODES = 1000
+# the chain re-deals up to this many cards at once
+BLOCK_SIZE = 4
+
+
+class SearchTimeout(Exception):
+    # find_deal ran out of time before finding a deal
+    pass
+
+
+class _Restart(Exception):
+    # a search attempt visited its node limit
+    pass
+
+
+class DealEstimates:
+    def __init__(
+        self,
+        sample_count,
+        player_probabilities,
+        solution_probabilities,
+        player_intervals,
+        solution_intervals,
+    ):
+        self.sample_count = sample_count
+        # player name -> card -> estimated probability the player holds the card
+        self.player_probabilities = player_probabilities
+        # card -> estimated probability the card is in the envelope
+        self.solution_probabilities = solution_probabilities
+        # same shapes, half width of the 95% confidence interval
+        self.player_intervals = player_intervals
+        self.solution_intervals = solution_intervals
+
+    def max_interval(self):
+        return max(
+            [
+                interval
+                for intervals in self.player_intervals.values()
+                for interval in intervals.values()
+            ]
+            + list(self.solution_intervals.values()),
+            default=0.0,
+        )
+
+    def __str__(self):
+        return f"{self.sample_count} sampled deals, 95% intervals within ±{self.max_interval():.1%}"
+
+
+def clause_literals(card_count, clauses):
+    # card -> [(clause index, hand)] of the clause literals on that card
+    literals_by_card = [[] for _ in range(card_count)]
+    for clause_index, (kind, literals) in enumerate(clauses):
+        for card, hand in literals:
+            literals_by_card[card].append((clause_index, hand))
+    return literals_by_card
+
+
+def find_deal(needs, allowed, clauses, rng, deadline=None):
+    # randomised backtracking search for one deal that satisfies everything,
+    # the start of a sampling chain. returns None if there is no such deal and
+    # raises SearchTimeout once time.time() passes deadline. an attempt
+    # that visits too many nodes restarts with a new random order and twice
+    # the limit, so one unlucky early choice does not stall the search
+    node_limit = SEARCH_NODES
+    while True:
+        try:
+            return search_deal(needs, allowed, clauses, rng, node_limit, deadline)
+        except _Restart:
+            node_limit *= 2
+
+
+def search_deal(needs, allowed, clauses, rng, node_limit, deadline):
+    card_count = len(allowed)
+    literals_by_card = clause_literals(card_count, clauses)
+    # cards with one possible hand first, then the ones in the most clauses
+    # as they decide the most
+    order = sorted(
+        range(card_count),
+        key=lambda card: (
+            len(allowed[card]) > 1,
+            -len(literals_by_card[card]),
+            len(allowed[card]),
+            rng.random(),
+        ),
+    )
+    needs = list(needs)
+    hand_of = [None] * card_count
+    # per clause, literals that hold and literals on cards not yet dealt
+    true_counts = [0] * len(clauses)
+    open_counts = [len(literals) for _, literals in clauses]
+    nodes = 0
+
+    def deal_card(card, hand):
+        # returns whether every clause on card can still hold
+        holds = True
+        for clause_index, literal_hand in literals_by_card[card]:
+            open_counts[clause_index] -= 1
+            if literal_hand == hand:
+                true_counts[clause_index] += 1
+            kind, literals = clauses[clause_index]
+            if kind == SOME:
+                if not true_counts[clause_index] and not open_counts[clause_index]:
+                    holds = False
+            elif true_counts[clause_index] == len(literals):
+                holds = False
+        return holds
+
+    def undeal_card(card, hand):
+        for clause_index, literal_hand in literals_by_card[card]:
+            open_counts[clause_index] += 1
+            if literal_hand == hand:
+                true_counts[clause_index] -= 1
+
+    def hands_left(card):
+        # the hands card may go to. a clause with one literal left that has
+        # to hold, or has to fail, leaves card one hand fewer
+        hands = allowed[card]
+        for clause_index, literal_hand in literals_by_card[card]:
+            if open_counts[clause_index] != 1:
+                continue
+            kind, literals = clauses[clause_index]
+            if kind == SOME and not true_counts[clause_index]:
+                hands = [hand for hand in hands if hand == literal_hand]
+            elif kind == NOT_ALL and true_counts[clause_index] == len(literals) - 1:
+                hands = [hand for hand in hands if hand != literal_hand]
+        return hands
+
+    def can_fill(i):
+        # whether the cards from position i on can fill every hand exactly,
+        # leaving the clauses aside: a matching of the cards to the places
+        # left in the hands, grown one card at a time by augmenting paths
+        holders = [[] for _ in needs]
+
+        def place(card, seen):
+            for hand in hands_of[card]:
+                if hand in seen:
+                    continue
+                seen.add(hand)
+                if len(holders[hand]) < needs[hand]:
+                    holders[hand].append(card)
+                    return True
+                for holder_index, holder in enumerate(holders[hand]):
+                    if place(holder, seen):
+                        holders[hand][holder_index] = card
+                        return True
+            return False
+
+        hands_of = {card: hands_left(card) for card in order[i:]}
+        return all(place(card, set()) for card in order[i:])
+
+    def search(i):
+        nonlocal nodes
+        if i == card_count:
+            return True
+        nodes += 1
+        if nodes > node_limit:
+            raise _Restart()
+        if deadline is not None and nodes % 256 == 0 and time.time() > deadline:
+            raise SearchTimeout()
+        card = order[i]
+        hands = list(hands_left(card))
+        rng.shuffle(hands)
+        for hand in hands:
+            if needs[hand] == 0:
+                continue
+            needs[hand] -= 1
+            hand_of[card] = hand
+            if deal_card(card, hand) and can_fill(i + 1) and search(i + 1):
+                return True
+            undeal_card(card, hand)
+            needs[hand] += 1
+            hand_of[card] = None
+        return False
+
+    if not search(0):
+        return None
+    return hand_of
+
+
+def sample_chain(problem, seed, samples, burn_in, deadline=None):
+    # markov chain over valid deals from a random start of its own. every
+    # step shuffles the hands of a few random cards between them, kept when
+    # every card may go to its new hand and every clause still holds. the
+    # proposal is symmetric so the chain samples consistent deals uniformly,
+    # and moving up to BLOCK_SIZE cards at once reaches deals a swap of two
+    # cards cannot. stops early at deadline, a time.time(), and returns the
+    # times each card was seen in each hand with the number of deals sampled,
+    # or None if there is no consistent deal
+    hand_count, needs, allowed, clauses = problem
+    rng = random.Random(seed)
+    search_deadline = time.time() + SEARCH_SECONDS if deadline is None else deadline
+    hand_of = find_deal(needs, allowed, clauses, rng, search_deadline)
+    if hand_of is None:
+        return None
+    card_count = len(hand_of)
+    allowed_sets = [set(hands) for hands in allowed]
+    literals_by_card = clause_literals(card_count, clauses)
+    true_counts = [
+        sum(1 for card, hand in literals if hand_of[card] == hand) for _, literals in clauses
+    ]
+    # only cards with a choice of hand can move
+    movable = [card for card in range(card_count) if len(allowed[card]) > 1]
+
+    def clause_deltas(block, hands, arrangement):
+        # change in true literals per clause, None if a clause would fail
+        deltas = {}
+        for card, old_hand, new_hand in zip(block, hands, arrangement):
+            if old_hand == new_hand:
+                continue
+            for clause_index, hand in literals_by_card[card]:
+                if hand == old_hand:
+                    deltas[clause_index] = deltas.get(clause_index, 0) - 1
+                elif hand == new_hand:
+                    deltas[clause_index] = deltas.get(clause_index, 0) + 1
+        for clause_index, delta in deltas.items():
+            kind, literals = clauses[clause_index]
+            true_count = true_counts[clause_index] + delta
+            if kind == SOME and true_count == 0:
+                return None
+            if kind == NOT_ALL and true_count == len(literals):
+                return None
+        return deltas
+
+    def redraw(block):
+        hands = [hand_of[card] for card in block]
+        arrangement = list(hands)
+        rng.shuffle(arrangement)
+        if arrangement == hands or any(
+            hand not in allowed_sets[card] for card, hand in zip(block, arrangement)
+        ):
+            return
+        deltas = clause_deltas(block, hands, arrangement)
+        if deltas is None:
+            return
+        for clause_index, delta in deltas.items():
+            true_counts[clause_index] += delta
+        for card, hand in zip(block, arrangement):
+            hand_of[card] = hand
+
+    counts = [[0] * hand_count for _ in range(card_count)]
+    if len(movable) < 2:
+        for card in range(card_count):
+            counts[card][hand_of[card]] = samples
+        return counts, samples
+
+    block_size = min(BLOCK_SIZE, len(movable))
+    steps_per_sample = len(movable)
+    sampled = 0
+    for step in range(burn_in + samples * steps_per_sample):
+        redraw(rng.sample(movable, rng.randint(2, block_size)))
+        if step >= burn_in and (step - burn_in) % steps_per_sample == steps_per_sample - 1:
+            for card in range(card_count):
+                counts[card][hand_of[card]] += 1
+            sampled += 1
+        if deadline is not None and step % steps_per_sample == 0 and time.time() > deadline:
+            break
+    return counts, sampled
+
+
+def sample_probabilities(
+    game, samples=20000, seconds=None, workers=None, batch_size=500, seed=None
+):
+    # yields refined DealEstimates every time a batch of samples finishes,
+    # until the sample or time budget is used up. every batch is a chain
+    # started from its own random deal on a process pool, and the spread
+    # between chains gives the intervals. yields nothing if no deal is
+    # consistent, and raises if no chain found a starting deal in time
+    constraints = DealConstraints(game)
+    if (
+        constraints.contradiction
+        or any(need is None for need in constraints.needs)
+        or sum(constraints.needs) != len(constraints.cards)
+    ):
+        return
+    rng = random.Random(seed)
+    problem = (
+        constraints.hand_count,
+        constraints.needs,
+        constraints.allowed,
+        constraints.clauses,
+    )
+    burn_in = 50 * len(constraints.cards)
+    workers = workers or os.cpu_count() or 1
+    deadline = None if seconds is None else time.monotonic() + seconds
+    # the same deadline for the workers, whose monotonic clocks may differ
+    chain_deadline = None if seconds is None else time.time() + seconds
+    # (counts, deals sampled) per finished chain
+    chains = []
+    submitted = 0
+    timed_out = False
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending = set()
+        try:
+            while True:
+                out_of_time = deadline is not None and time.monotonic() >= deadline
+                while (
+                    not out_of_time
+                    and len(pending) < 2 * workers
+                    and submitted * batch_size < samples
+                ):
+                    pending.add(
+                        executor.submit(
+                            sample_chain,
+                            problem,
+                            rng.getrandbits(64),
+                            batch_size,
+                            burn_in,
+                            chain_deadline,
+                        )
+                    )
+                    submitted += 1
+                if not pending:
+                    break
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        chain = future.result()
+                    except SearchTimeout:
+                        timed_out = True
+                        continue
+                    if chain is None:
+                        # the search proved no deal is consistent
+                        return
+                    # a chain cut short by the deadline before its burn in
+                    # ended has nothing to add
+                    if chain[1]:
+                        chains.append(chain)
+                if timed_out and not chains:
+                    break
+                if done and chains:
+                    yield estimates(game, constraints, chains)
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        finally:
+            # out of time, or the caller stopped early, e.g. a newer save
+            # cancelled the recompute: drop the batches not started yet
+            for future in pending:
+                future.cancel()
+    if not chains:
+        budget = SEARCH_SECONDS if seconds is None else seconds
+        raise Exception(
+            f"found no deal consistent with the events in {budget:g}s, "
+            "try a larger --seconds"
+        )
+
+
+def estimates(game, constraints, chains):
+    chain_total = len(chains)
+    sample_count = sum(sampled for _, sampled in chains)
+    player_count = len(game.players)
+
+    def estimate(card_index, hands):
+        chain_hits = [sum(counts[card_index][hand] for hand in hands) for counts, _ in chains]
+        mean = sum(chain_hits) / sample_count
+        if chain_total > 1:
+            chain_means = [hits / sampled for hits, (_, sampled) in zip(chain_hits, chains)]
+            variance = sum((m - mean) ** 2 for m in chain_means) / (chain_total - 1)
+            interval = Z_95 * math.sqrt(variance / chain_total)
+        else:
+            # one chain says nothing about how far chains disagree
+            interval = 1.0
+        return mean, interval
+
+    player_probabilities = {player.name: {} for player in game.players}
+    player_intervals = {player.name: {} for player in game.players}
+    solution_probabilities = {}
+    solution_intervals = {}
+    envelope_hands = range(player_count, constraints.hand_count)
+    for card_index, card in enumerate(constraints.cards):
+        for player_index, player in enumerate(game.players):
+            mean, interval = estimate(card_index, [player_index])
+            player_probabilities[player.name][card] = mean
+            player_intervals[player.name][card] = interval
+        mean, interval = estimate(card_index, envelope_hands)
+        solution_probabilities[card] = mean
+        solution_intervals[card] = interval
+    return DealEstimates(
+        sample_count,
+        player_probabilities,
+        solution_probabilities,
+        player_intervals,
+        solution_intervals,
+    )
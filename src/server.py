@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import uuid
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlsplit
+
+from batch import knowledge_matrix
+from clue import apply_events, explain, init, process_events
+from game import Contradiction
+
+MAX_BODY = 1 << 20
+REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def deep_size(obj):
+    # rough bytes held by a game: every object reachable through containers,
+    # instance attributes and slots, each counted once
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif not isinstance(obj, (str, bytes, int, float, bool)):
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+            for slot in getattr(type(obj), "__slots__", ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return size
+
+
+class GameStore:
+    # live games in an lru cache capped by their estimated memory. every game
+    # keeps its setup and compiled events, so an evicted game is rebuilt by
+    # replaying them without parsing anything
+
+    def __init__(self, memory_cap):
+        self.memory_cap = memory_cap
+        # game id -> (setup, compiled events)
+        self.logs = {}
+        # game id -> [game, estimated bytes, events when last measured]
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def create(self, setup, events, game_id=None):
+        game_id = str(game_id or uuid.uuid4().hex[:12])
+        if game_id in self.logs:
+            raise HttpError(409, f"game {game_id} already exists")
+        try:
+            game = init(setup)
+            compiled_events = process_events(game, events)
+        except Contradiction as e:
+            raise HttpError(409, str(e))
+        except Exception as e:
+            raise HttpError(400, f"invalid game: {e}")
+        self.logs[game_id] = (setup, compiled_events)
+        self.cache_game(game_id, game)
+        return game_id
+
+    def get(self, game_id):
+        if game_id not in self.logs:
+            raise HttpError(404, f"no game {game_id}")
+        entry = self.cache.get(game_id)
+        if entry is not None:
+            self.hits += 1
+            self.cache.move_to_end(game_id)
+            return entry[0]
+        self.misses += 1
+        setup, compiled_events = self.logs[game_id]
+        game = init(setup)
+        apply_events(game, compiled_events)
+        self.cache_game(game_id, game)
+        return game
+
+    def append(self, game_id, events):
+        # all or none of the events are applied
+        game = self.get(game_id)
+        snapshot = game.snapshot()
+        try:
+            compiled_events = process_events(game, events)
+        except Exception as e:
+            game.restore(snapshot)
+            raise HttpError(409 if isinstance(e, Contradiction) else 400, str(e))
+        self.logs[game_id][1].extend(compiled_events)
+        self.measure(game_id)
+        return game
+
+    def delete(self, game_id):
+        if self.logs.pop(game_id, None) is None:
+            raise HttpError(404, f"no game {game_id}")
+        entry = self.cache.pop(game_id, None)
+        if entry is not None:
+            self.cached_bytes -= entry[1]
+
+    def cache_game(self, game_id, game):
+        self.cache[game_id] = [game, 0, -1]
+        self.measure(game_id)
+
+    def measure(self, game_id):
+        # sizing walks the whole game, so only redo it once the game has
+        # grown by a quarter since it was last measured
+        entry = self.cache[game_id]
+        game, size, measured_at = entry
+        if measured_at >= 0 and game.events_applied < measured_at * 1.25 + 8:
+            return
+        new_size = deep_size(game)
+        self.cached_bytes += new_size - size
+        entry[1] = new_size
+        entry[2] = game.events_applied
+        self.evict(keep=game_id)
+
+    def evict(self, keep):
+        while self.cached_bytes > self.memory_cap and len(self.cache) > 1:
+            game_id = next(iter(self.cache))
+            if game_id == keep:
+                self.cache.move_to_end(game_id)
+                continue
+            _, size, _ = self.cache.pop(game_id)
+            self.cached_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "games": len(self.logs),
+            "cached_games": len(self.cache),
+            "cached_bytes": self.cached_bytes,
+            "memory_cap": self.memory_cap,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def sheet_json(game_id, game):
+    solution = None
+    if game.is_solved():
+        solution = {
+            "suspect": game.suspect_solution(),
+            "weapon": game.weapon_solution(),
+            "room": game.room_solution(),
+        }
+    return {
+        "id": game_id,
+        "events": game.events_applied,
+        "solution": solution,
+        "knowledge": knowledge_matrix(game),
+    }
+
+
+def sheet_response(game_id, game, query):
+    if query.get("format", ["text"])[0] == "json":
+        return 200, sheet_json(game_id, game)
+    game.view = "sheet"
+    return 200, str(game)
+
+
+def read_json(body):
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise HttpError(400, f"invalid json: {e}")
+
+
+class GameServer:
+    # POST   /games              {"setup": ..., "events": [...], "id": ...}
+    # GET    /games/ID           the sheet as text, or json with ?format=json
+    # POST   /games/ID/events    an event or a list of events, then the sheet
+    # GET    /games/ID/explain   ?player=...&card=..., the reasoning behind a cell
+    # DELETE /games/ID
+    # GET    /stats              cache counters
+
+    def __init__(self, store):
+        self.store = store
+
+    def route(self, method, path, query, body):
+        parts = [part for part in path.split("/") if part]
+        if parts == ["stats"] and method == "GET":
+            return 200, self.store.stats()
+        if parts == ["games"] and method == "POST":
+            data = read_json(body)
+            if not isinstance(data, dict) or "setup" not in data:
+                raise HttpError(400, "expected {\"setup\": ..., \"events\": [...]}")
+            game_id = self.store.create(
+                data["setup"], data.get("events") or [], data.get("id")
+            )
+            return 201, {"id": game_id}
+        if len(parts) == 2 and parts[0] == "games":
+            if method == "GET":
+                return sheet_response(parts[1], self.store.get(parts[1]), query)
+            if method == "DELETE":
+                self.store.delete(parts[1])
+                return 200, {"deleted": parts[1]}
+        if len(parts) == 3 and parts[0] == "games" and parts[2] == "events":
+            if method == "POST":
+                events = read_json(body)
+                events = events if isinstance(events, list) else [events]
+                game = self.store.append(parts[1], events)
+                return sheet_response(parts[1], game, query)
+        if len(parts) == 3 and parts[0] == "games" and parts[2] == "explain":
+            if method == "GET":
+                game = self.store.get(parts[1])
+                try:
+                    return 200, explain(game, query["player"][0], query["card"][0])
+                except KeyError:
+                    raise HttpError(400, "expected ?player=...&card=...")
+                except Exception as e:
+                    raise HttpError(400, str(e))
+        if parts[:1] in (["games"], ["stats"]):
+            raise HttpError(405, f"{method} not allowed on {path}")
+        raise HttpError(404, f"nothing at {path}")
+
+    async def handle_connection(self, reader, writer):
+        # http/1.1 with keep alive, one request at a time per connection
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY:
+                        raise HttpError(413, "request body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    url = urlsplit(target)
+                    status, payload = self.route(
+                        method, url.path, parse_qs(url.query), body
+                    )
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except ValueError:
+                    status, payload = 400, {"error": "malformed request"}
+                    version = "HTTP/1.0"
+                except Exception as e:
+                    logging.exception("request failed")
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                keep_alive = (
+                    version == "HTTP/1.1" and headers.get("connection") != "close"
+                ) or headers.get("connection") == "keep-alive"
+                writer.write(response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def response(status, payload, keep_alive):
+    if isinstance(payload, str):
+        content_type = "text/plain; charset=utf-8"
+        body = payload.encode()
+    else:
+        content_type = "application/json"
+        body = json.dumps(payload).encode()
+    head = (
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+async def serve(host, port, store):
+    server = await asyncio.start_server(
+        GameServer(store).handle_connection, host, port
+    )
+    print(f"serving games on http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="serve many clue sheets over http")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--memory-mb",
+        type=float,
+        default=256,
+        help="estimated memory of the games kept live, least recently used "
+        "games over the cap are dropped and rebuilt from their events on use",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    store = GameStore(int(args.memory_mb * 1024 * 1024))
+    try:
+        asyncio.run(serve(args.host, args.port, store))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
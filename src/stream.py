@@ -0,0 +1,137 @@
+import asyncio
+import os
+import stat
+import sys
+
+from gamefile import parse_event
+
+
+def is_record(line):
+    # blank lines and comments are skipped
+    line = line.strip()
+    return line != "" and not line.startswith("#")
+
+
+class EventStream:
+    # applies events to the live game as they arrive and redraws the sheet.
+    # reading, inference and drawing are separate tasks: readers only queue
+    # lines, and events queued while the sheet was being drawn are applied
+    # together and drawn once. handle_record(record) applies one record and
+    # returns whether it was an event, draw(footer) runs on a thread
+
+    def __init__(self, handle_record, draw):
+        self.handle_record = handle_record
+        self.draw = draw
+        # (line, future for the reply or None)
+        self.queue = asyncio.Queue()
+        # set to wake the render task, which draws if needs_draw is set and
+        # returns once finished is
+        self.changed = asyncio.Event()
+        self.needs_draw = False
+        self.finished = False
+        self.event_count = 0
+        self.latest_error = None
+
+    def footer(self):
+        ret = f"\n{self.event_count} events streamed\n"
+        if self.latest_error is not None:
+            ret += f"latest error: {self.latest_error}\n"
+        return ret
+
+    async def apply_events(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            for line, reply in batch:
+                try:
+                    if self.handle_record(parse_event(line)):
+                        self.event_count += 1
+                    result = "ok"
+                except Exception as e:
+                    self.latest_error = f"{line.strip()}: {e}"
+                    result = f"error: {e}"
+                if reply is not None and not reply.done():
+                    reply.set_result(result)
+                self.queue.task_done()
+            self.needs_draw = True
+            self.changed.set()
+            # a busy stream never waits on the queue, give the drawing a turn
+            await asyncio.sleep(0)
+
+    async def render(self):
+        # drawing can take a while, e.g. sampling with --sample, so it runs on
+        # a thread while records keep being applied and answered
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            if self.needs_draw:
+                self.needs_draw = False
+                await loop.run_in_executor(None, self.draw, self.footer())
+            if self.finished and not self.needs_draw:
+                return
+
+    async def read_stdin(self):
+        # blocking reads happen on a thread so the loop keeps applying and
+        # drawing, this also works when stdin is a regular file
+        while True:
+            line = await asyncio.to_thread(sys.stdin.readline)
+            if not line:
+                return
+            if is_record(line):
+                self.queue.put_nowait((line, None))
+
+    async def handle_client(self, reader, writer):
+        # each record is answered with "ok" or "error: ..." once it is applied
+        loop = asyncio.get_running_loop()
+        try:
+            while line := await reader.readline():
+                line = line.decode()
+                if not is_record(line):
+                    continue
+                reply = loop.create_future()
+                self.queue.put_nowait((line, reply))
+                writer.write(f"{await reply}\n".encode())
+                await writer.drain()
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, source):
+        # source is "-" for stdin, which ends the stream at end of input, or
+        # the path of a unix socket to listen on until interrupted
+        renderer = asyncio.create_task(self.render())
+        tasks = [asyncio.create_task(self.apply_events()), renderer]
+        # first frame is the state loaded from the game file
+        self.needs_draw = True
+        self.changed.set()
+        try:
+            if source == "-":
+                await self.read_stdin()
+                await self.queue.join()
+                # let the render task draw what is left and finish
+                self.finished = True
+                self.changed.set()
+                await renderer
+            else:
+                remove_stale_socket(source)
+                server = await asyncio.start_unix_server(self.handle_client, path=source)
+                try:
+                    async with server:
+                        await server.serve_forever()
+                finally:
+                    remove_stale_socket(source)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def remove_stale_socket(path):
+    # never remove anything that is not a socket
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
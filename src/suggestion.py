@@ -1,10 +1,33 @@
+from weakref import WeakValueDictionary
+
+# (player name, suspect, weapon, room) -> the one Suggestion for it
+_interned = WeakValueDictionary()
+
+
 class Suggestion:
-    def __init__(self, player_name, suspect=None, weapon=None, room=None):
+    # a suggestion or accusation, a record interned by make_suggestion so a
+    # game repeating the same suggestion holds it once. it is shared, so it
+    # is never changed, and what happened to it, e.g. which event made it, is
+    # kept by whoever holds it
+    __slots__ = ("player_name", "suspect", "weapon", "room", "__weakref__")
+
+    def __init__(self, player_name, suspect, weapon, room):
         self.player_name = player_name
         self.suspect = suspect
         self.weapon = weapon
         self.room = room
-        self.solved = False
+
+    def __reduce__(self):
+        # unpickled suggestions, e.g. from a checkpoint, are interned again
+        return make_suggestion, (self.player_name, self.suspect, self.weapon, self.room)
 
     def __str__(self):
         return f"{self.player_name} guesses: {self.suspect}, {self.weapon}, {self.room}"
+
+
+def make_suggestion(player_name, suspect, weapon, room):
+    key = (player_name, suspect, weapon, room)
+    suggestion = _interned.get(key)
+    if suggestion is None:
+        suggestion = _interned[key] = Suggestion(*key)
+    return suggestion
@@ -0,0 +1,131 @@
+import os
+
+GAME_EXTENSIONS = (".yml", ".yaml")
+TILE_GAP = 3
+COMMANDS_HELP = (
+    "enter a table's number or file name to show it, n or p for the next or "
+    "previous table, t to tile every table"
+)
+
+
+def is_game_file(path):
+    return path.endswith(GAME_EXTENSIONS)
+
+
+class Table:
+    # one game file of a watched directory, its game kept between changes by
+    # its own session so only the events added to this file are processed
+
+    def __init__(self, filename, session):
+        self.filename = filename
+        self.name = os.path.basename(filename)
+        self.session = session
+        self.error = None
+        # updated since it was last shown on its own
+        self.unseen = False
+
+    @property
+    def game(self):
+        return self.session.game
+
+    def update(self, load_game):
+        # load_game(filename, session) as clue.load_game. on an error the
+        # game keeps the events before it
+        try:
+            load_game(self.filename, self.session)
+            self.error = None
+        except Exception as e:
+            self.error = str(e)
+        self.unseen = True
+
+    def sheet_str(self, view):
+        ret = f"== {self.name} ==\n"
+        if self.game is not None:
+            self.game.view = view
+            ret += str(self.game)
+        if self.error is not None:
+            ret += f"\nlatest error: {self.error}\n"
+        return ret
+
+
+class TableView:
+    # the tables of a directory, shown one at a time with the others listed
+    # below it, or all of them tiled
+
+    def __init__(self, tiled=False):
+        # file name -> Table
+        self.tables = {}
+        # name of the table shown on its own
+        self.focus = None
+        self.tiled = tiled
+
+    def names(self):
+        return sorted(self.tables)
+
+    def focused(self):
+        # the table shown on its own, None if there are no tables
+        names = self.names()
+        if not names:
+            return None
+        if self.focus not in self.tables:
+            self.focus = names[0]
+        return self.tables[self.focus]
+
+    def command(self, line):
+        # see COMMANDS_HELP, returns whether the view changed
+        line = line.strip()
+        names = self.names()
+        if not line or not names:
+            return False
+        if line == "t":
+            self.tiled = not self.tiled
+            return True
+        focus = self.focused().name
+        if line in ("n", "p"):
+            step = 1 if line == "n" else -1
+            focus = names[(names.index(focus) + step) % len(names)]
+        elif line.isdigit() and 1 <= int(line) <= len(names):
+            focus = names[int(line) - 1]
+        elif line in self.tables:
+            focus = line
+        else:
+            return False
+        changed = self.tiled or focus != self.focus
+        self.focus = focus
+        self.tiled = False
+        return changed
+
+    def tables_str(self):
+        # the tables by number, the shown one in brackets and the ones
+        # updated since they were last shown marked with a *
+        ret = "\nTABLES:"
+        for number, name in enumerate(self.names(), 1):
+            label = f"{number} {name}{'*' if self.tables[name].unseen else ''}"
+            ret += f" [{label}]" if name == self.focus and not self.tiled else f" {label}"
+        return ret + f"\n{COMMANDS_HELP}\n"
+
+    def tiled_str(self, view, width):
+        tables = [self.tables[name] for name in self.names()]
+        for table in tables:
+            table.unseen = False
+        return tile([table.sheet_str(view) for table in tables], width) + self.tables_str()
+
+
+def tile(blocks, width):
+    # lay blocks of text out side by side, in as many columns as fit in width
+    blocks = [block.rstrip("\n").split("\n") for block in blocks]
+    if not blocks:
+        return ""
+    column_width = max(len(line) for block in blocks for line in block) + TILE_GAP
+    columns = max(1, (width + TILE_GAP) // column_width)
+    lines = []
+    for start in range(0, len(blocks), columns):
+        row = blocks[start : start + columns]
+        for line_index in range(max(len(block) for block in row)):
+            line = ""
+            for block in row:
+                text = block[line_index] if line_index < len(block) else ""
+                line += f"{text:<{column_width}}"
+            lines.append(line.rstrip())
+        lines.append("")
+    return "\n".join(lines)
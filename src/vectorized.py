@@ -0,0 +1,348 @@
+import argparse
+import logging
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is a dev dependency, only this module needs it
+    np = None
+
+from batch import game_files, knowledge_matrix
+from clue import compile_event, init, process_events
+from game import Contradiction, iter_bits
+from gamefile import load_yaml
+
+# cells of the knowledge matrix
+UNKNOWN = 0
+HAS = 1
+LACKS = -1
+
+CELL_NAMES = {UNKNOWN: "unknown", HAS: "has", LACKS: "lacks"}
+
+
+def require_numpy():
+    if np is None:
+        raise Exception("the vectorized engine needs numpy, install it with pipenv install --dev")
+
+
+class GameBatch:
+    # many games evaluated at once as arrays with a leading game dimension.
+    # each game is a players x cards int8 matrix of UNKNOWN, HAS or LACKS,
+    # plus the answered suggestions and failed accusations as arrays of card
+    # indexes. the rules of clue.py and player.py are applied to every game
+    # together until nothing changes, which gives the same sheet as applying
+    # the events one by one. games with fewer players or cards are padded
+    # with players and cards that lack everything, which no rule reacts to
+
+    def __init__(self, games):
+        # games is a list of (setup, events) as parsed from game files
+        require_numpy()
+        self.games = []
+        compiled_games = []
+        for setup, events in games:
+            game = init(setup)
+            self.games.append(game)
+            compiled_games.append([compile_event(game, event) for event in events])
+
+        batch_size = len(self.games)
+        player_count = max((len(game.players) for game in self.games), default=0)
+        card_count = max((len(game.cards_by_index) for game in self.games), default=0)
+        clause_count = max(
+            (sum(is_clause(compiled) for compiled in compiled_events)
+             for compiled_events in compiled_games),
+            default=0,
+        )
+        accusation_count = max(
+            (sum(compiled[0] == "accuse" for compiled in compiled_events)
+             for compiled_events in compiled_games),
+            default=0,
+        )
+
+        has = np.zeros((batch_size, player_count, card_count), dtype=bool)
+        lacks = np.ones((batch_size, player_count, card_count), dtype=bool)
+        self.card_counts = np.zeros((batch_size, player_count), dtype=np.int16)
+        # suspects, weapons and rooms as a mask over the cards of each game
+        self.sections = np.zeros((batch_size, 3, card_count), dtype=bool)
+        self.not_solution = np.zeros((batch_size, card_count), dtype=bool)
+        # the player who answered and the three suggested cards
+        self.clause_players = np.zeros((batch_size, clause_count), dtype=np.int16)
+        self.clause_cards = np.zeros((batch_size, clause_count, 3), dtype=np.int16)
+        self.clause_valid = np.zeros((batch_size, clause_count), dtype=bool)
+        self.accusation_cards = np.zeros((batch_size, accusation_count, 3), dtype=np.int16)
+        self.accusation_valid = np.zeros((batch_size, accusation_count), dtype=bool)
+
+        for index, (game, compiled_events) in enumerate(zip(self.games, compiled_games)):
+            players = len(game.players)
+            cards = len(game.cards_by_index)
+            lacks[index, :players, :cards] = False
+            for player in game.players:
+                self.card_counts[index, player.index] = player.card_count
+                for bit in iter_bits(player.has_mask):
+                    has[index, player.index, bit.bit_length() - 1] = True
+                for bit in iter_bits(player.does_not_have_mask):
+                    lacks[index, player.index, bit.bit_length() - 1] = True
+            for section, mask in enumerate(
+                (game.suspects_mask, game.weapons_mask, game.rooms_mask)
+            ):
+                for bit in iter_bits(mask):
+                    self.sections[index, section, bit.bit_length() - 1] = True
+            self.add_events(index, game, compiled_events, has, lacks)
+
+        self.contradiction = (has & lacks).any(axis=(1, 2))
+        self.knowledge = np.where(has, HAS, np.where(lacks, LACKS, UNKNOWN)).astype(np.int8)
+        self.iterations = 0
+
+    def add_events(self, index, game, compiled_events, has, lacks):
+        # the facts each event states directly, everything else is inferred
+        # by solve
+        players = len(game.players)
+        clauses = 0
+        accusations = 0
+        for compiled in compiled_events:
+            kind = compiled[0]
+            if kind == "q":
+                asker, suspect, weapon, room, answerer, shown = compiled[1:]
+                suggested = [suspect, weapon, room]
+                if answerer is None:
+                    for player in range(players):
+                        if player != asker:
+                            lacks[index, player, suggested] = True
+                    continue
+                for player in players_between(players, asker, answerer):
+                    lacks[index, player, suggested] = True
+                if shown is not None:
+                    has[index, answerer, shown] = True
+                else:
+                    self.clause_players[index, clauses] = answerer
+                    self.clause_cards[index, clauses] = suggested
+                    self.clause_valid[index, clauses] = True
+                    clauses += 1
+            elif kind == "r":
+                player, card = compiled[1:]
+                if player is None:
+                    lacks[index, :players, card] = True
+                else:
+                    has[index, player, card] = True
+            else:
+                self.accusation_cards[index, accusations] = compiled[2:5]
+                self.accusation_valid[index, accusations] = True
+                accusations += 1
+
+    def solve(self):
+        # apply every rule to every game until no game learns anything new,
+        # returns the number of sweeps. a game whose facts contradict each
+        # other is flagged in self.contradiction and left as it is
+        games = np.arange(len(self.games))
+        while True:
+            self.iterations += 1
+            knowledge = self.knowledge
+            has = knowledge == HAS
+            lacks = knowledge == LACKS
+            unknown = knowledge == UNKNOWN
+            new_has = np.zeros_like(has)
+            new_lacks = np.zeros_like(lacks)
+            new_not_solution = np.zeros_like(self.not_solution)
+            contradiction = np.zeros_like(self.contradiction)
+
+            # a card has only one owner
+            owner_count = has.sum(axis=1)
+            owned = owner_count > 0
+            contradiction |= (owner_count > 1).any(axis=1)
+            new_lacks |= owned[:, None, :] & ~has
+
+            # a player holding all of their cards lacks the rest, and a player
+            # with as many cards left as cards they could have has them all.
+            # like player.add_card, a player with no cards at all is never
+            # saturated since no card is ever added to them
+            has_count = has.sum(axis=2)
+            unknown_count = unknown.sum(axis=2)
+            missing = self.card_counts - has_count
+            new_lacks |= ((missing == 0) & (has_count > 0))[:, :, None] & unknown
+            new_has |= ((unknown_count == missing) & (missing > 0))[:, :, None] & unknown
+            contradiction |= ((missing < 0) | (unknown_count < missing)).any(axis=1)
+
+            # a player who answered a suggestion and lacks two of its cards
+            # has the third
+            clause_cells = knowledge[
+                games[:, None, None], self.clause_players[:, :, None], self.clause_cards
+            ]
+            clause_open = clause_cells != LACKS
+            open_count = clause_open.sum(axis=2)
+            forced = (
+                self.clause_valid
+                & (open_count == 1)
+                & ~(clause_cells == HAS).any(axis=2)
+            )
+            game_index, clause_index, position = np.nonzero(forced[:, :, None] & clause_open)
+            new_has[
+                game_index,
+                self.clause_players[game_index, clause_index],
+                self.clause_cards[game_index, clause_index, position],
+            ] = True
+            contradiction |= (self.clause_valid & (open_count == 0)).any(axis=1)
+
+            # a card nobody has is the solution of its section, and a section
+            # can only have one
+            solution = lacks.all(axis=1) & self.sections.any(axis=1)
+            section_solutions = (solution[:, None, :] & self.sections).sum(axis=2)
+            contradiction |= (section_solutions > 1).any(axis=1)
+            contradiction |= (solution & self.not_solution).any(axis=1)
+
+            # the last card of a section that is neither held nor ruled out is
+            # the solution
+            remaining = self.sections & ~(owned | self.not_solution)[:, None, :]
+            remaining_count = remaining.sum(axis=2)
+            contradiction |= (remaining_count == 0).any(axis=1)
+            last_card = (remaining & (remaining_count == 1)[:, :, None]).any(axis=1)
+            new_lacks |= last_card[:, None, :] & unknown
+
+            # once a section's solution is known, an unowned card of it that
+            # only one player could have is theirs
+            solved_cards = (self.sections & (section_solutions > 0)[:, :, None]).any(axis=1)
+            only_owner = solved_cards & ~owned & (unknown.sum(axis=1) == 1)
+            new_has |= only_owner[:, None, :] & unknown
+
+            # a failed accusation with two cards of the solution rules out the third
+            accused_solution = solution[games[:, None, None], self.accusation_cards]
+            accused_count = accused_solution.sum(axis=2)
+            contradiction |= (self.accusation_valid & (accused_count == 3)).any(axis=1)
+            game_index, accusation_index, position = np.nonzero(
+                (self.accusation_valid & (accused_count == 2))[:, :, None] & ~accused_solution
+            )
+            new_not_solution[
+                game_index, self.accusation_cards[game_index, accusation_index, position]
+            ] = True
+
+            contradiction |= (
+                (new_has & (lacks | new_lacks)) | (new_lacks & has)
+            ).any(axis=(1, 2))
+            contradiction |= (new_not_solution & solution).any(axis=1)
+            self.contradiction |= contradiction
+
+            active = ~self.contradiction
+            new_has &= unknown & active[:, None, None]
+            new_lacks &= unknown & active[:, None, None]
+            new_not_solution &= ~self.not_solution & active[:, None]
+            if not (new_has.any() or new_lacks.any() or new_not_solution.any()):
+                return self.iterations
+            knowledge[new_has] = HAS
+            knowledge[new_lacks] = LACKS
+            self.not_solution |= new_not_solution
+
+    def knowledge_matrix(self, index):
+        # player name -> card -> "has", "lacks" or "unknown", as batch.knowledge_matrix
+        game = self.games[index]
+        return {
+            player.name: {
+                card: CELL_NAMES[int(self.knowledge[index, player.index, card_index])]
+                for card_index, card in enumerate(game.cards_by_index)
+            }
+            for player in game.players
+        }
+
+    def solution(self, index):
+        # {"suspect": ..., "weapon": ..., "room": ...} once solved, else None
+        game = self.games[index]
+        cards = len(game.cards_by_index)
+        nobody_has = (self.knowledge[index, : len(game.players), :cards] == LACKS).all(axis=0)
+        ret = {}
+        for section, name in enumerate(("suspect", "weapon", "room")):
+            found = np.nonzero(nobody_has & self.sections[index, section, :cards])[0]
+            if len(found) == 0:
+                return None
+            ret[name] = game.cards_by_index[found[0]]
+        return ret
+
+
+def is_clause(compiled):
+    # a suggestion answered without saying which card was shown
+    return compiled[0] == "q" and compiled[5] is not None and compiled[6] is None
+
+
+def players_between(player_count, asker, answerer):
+    # the players who were asked before the answerer and could not answer,
+    # in the same seating order as clue.process_suggestion
+    if asker == answerer:
+        return []
+    if asker < answerer:
+        return list(range(asker + 1, answerer))
+    return list(range(0, answerer)) + list(range(asker + 1, player_count))
+
+
+def object_result(setup, events):
+    # the sheet and solution from the object engine, None if it contradicts
+    game = init(setup)
+    try:
+        process_events(game, events)
+    except Contradiction:
+        return None
+    solution = None
+    if game.is_solved():
+        solution = {
+            "suspect": game.suspect_solution(),
+            "weapon": game.weapon_solution(),
+            "room": game.room_solution(),
+        }
+    return knowledge_matrix(game), solution
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="solve game files with the vectorized engine and check the "
+        "sheets match the object engine"
+    )
+    parser.add_argument("paths", nargs="+", help="directories or globs of game files")
+    parser.add_argument(
+        "--copies",
+        type=int,
+        default=1,
+        help="solve every game this many times in the batch, to time large batches",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    require_numpy()
+    games = []
+    files = game_files(args.paths)
+    for filename in files:
+        with open(filename, "rb") as file:
+            data = load_yaml(file.read())
+        games.append((data["setup"], data["events"]))
+
+    start = time.perf_counter()
+    expected = [object_result(setup, events) for setup, events in games]
+    object_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = GameBatch(games * args.copies)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    iterations = batch.solve()
+    solve_seconds = time.perf_counter() - start
+
+    mismatches = 0
+    for index, filename in enumerate(files * args.copies):
+        want = expected[index % len(files)]
+        if batch.contradiction[index]:
+            got = None
+        else:
+            got = batch.knowledge_matrix(index), batch.solution(index)
+        if got != want:
+            mismatches += 1
+            print(f"{filename}: the vectorized engine disagrees", file=sys.stderr)
+
+    print(
+        f"{len(batch.games)} games, {mismatches} mismatches, {iterations} sweeps\n"
+        f"object engine {object_seconds * args.copies:.3f}s (estimated), "
+        f"vectorized build {build_seconds:.3f}s, solve {solve_seconds:.3f}s"
+    )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))